@@ -0,0 +1,28 @@
+# atomic_files.py
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temp path next to `path`, moved over `path` once the block succeeds.
+
+    Temp names are unique, so concurrent writers never share one, and start
+    with an underscore so Parquet dataset discovery skips them. On error the
+    temp file is removed and `path` is left as it was.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix="_", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_json(path, data, **kwargs):
+    """Write JSON atomically (see atomic_path)."""
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(data, f, **kwargs)
@@ -0,0 +1,134 @@
+# complaints_breakdown.py
+import os
+import pandas as pd
+from fiscal_calendar import add_fiscal_periods
+from complaints_cube import cube_folder, load_cube, update_cube
+from workbook_cache import clean_text
+
+# Breakdowns already computed by this process, keyed by workbook version
+_breakdowns = {}
+
+def label_complaints(complaints_df):
+    """Label every complaint with its FY, quarter and unit (Cost Centre) once."""
+    complaints = add_fiscal_periods(complaints_df, 'Case Created Date')
+    is_product = complaints['Problem Sub-Type'] == 'Product'
+    return pd.DataFrame({
+        'FY': complaints['FY'].astype(object),
+        'Quarter': complaints['Quarter'].astype(object),
+        'Unit': complaints['Cost Centre'],
+        'is_product': is_product,
+        'product_code': complaints['Simple Product Code'].where(is_product),
+    })
+
+def label_orders(orders_df):
+    """Label every order line with its FY, quarter and unit (Business Unit) once."""
+    orders = add_fiscal_periods(orders_df, 'Order Date')
+    return pd.DataFrame({
+        'FY': orders['FY'].astype(object),
+        'Quarter': orders['Quarter'].astype(object),
+        'Unit': orders['Business Unit'],
+        'order_no': orders['Order No'],
+        'item': clean_text(orders['Item'], lower=True),
+    })
+
+def quarterly_breakdown(complaints_df, orders_df=None, by_unit=True):
+    """
+    Complaints and orders for every fiscal year x quarter (x unit) in one grouped pass.
+
+    Returns a DataFrame indexed by FY, Quarter and, with `by_unit`, Unit
+    (Cost Centre for complaints, Business Unit for orders) with columns
+    'Complaints', 'Product Complaints', 'Products Complained About' and,
+    given orders, 'Unique Orders', 'Unique Products Ordered' and
+    'Complaint Rate (%)'. Distinct counts are exact at each level, so use
+    by_unit=False for quarter totals rather than summing units.
+    """
+    keys = ['FY', 'Quarter'] + (['Unit'] if by_unit else [])
+    breakdown = label_complaints(complaints_df).groupby(keys, observed=True).agg(
+        **{'Complaints': ('is_product', 'size'),
+           'Product Complaints': ('is_product', 'sum'),
+           'Products Complained About': ('product_code', 'nunique')})
+    if orders_df is None:
+        return breakdown
+
+    return join_orders(breakdown, order_breakdown(orders_df, by_unit))
+
+def order_breakdown(orders_df, by_unit=True):
+    """The order half of quarterly_breakdown: 'Unique Orders' and 'Unique Products Ordered'."""
+    keys = ['FY', 'Quarter'] + (['Unit'] if by_unit else [])
+    return label_orders(orders_df).groupby(keys, observed=True).agg(
+        **{'Unique Orders': ('order_no', 'nunique'),
+           'Unique Products Ordered': ('item', 'nunique')})
+
+def join_orders(breakdown, orders):
+    """Put complaint and order counts side by side and add the complaint rate."""
+    breakdown = breakdown.join(orders, how='outer').fillna(0).astype('int64')
+    rate = breakdown['Complaints'] / breakdown['Unique Orders'] * 100
+    breakdown['Complaint Rate (%)'] = rate.where(breakdown['Unique Orders'] > 0, 0.0)
+    return breakdown
+
+def cube_breakdown(cube, by_unit=True):
+    """quarterly_breakdown computed from the aggregate cube instead of raw rows."""
+    complaints = cube['complaints'].rename(columns={'Cost Centre': 'Unit'})
+    is_product = complaints['Problem Sub-Type'] == 'Product'
+    complaints = complaints.assign(
+        product_complaints=complaints['Complaints'].where(is_product, 0),
+        product_code=complaints['Simple Product Code'].where(is_product))
+    keys = ['FY', 'Quarter'] + (['Unit'] if by_unit else [])
+    breakdown = complaints.groupby(keys, observed=True).agg(
+        **{'Complaints': ('Complaints', 'sum'),
+           'Product Complaints': ('product_complaints', 'sum'),
+           'Products Complained About': ('product_code', 'nunique')})
+
+    orders = cube['orders'].rename(columns={'Business Unit': 'Unit'})
+    items = cube['items'].rename(columns={'Business Unit': 'Unit'})
+    orders = pd.DataFrame({
+        'Unique Orders': orders.groupby(keys, observed=True)['Order No'].nunique(),
+        'Unique Products Ordered': items.groupby(keys, observed=True)['Item'].nunique(),
+    })
+    return join_orders(breakdown, orders)
+
+def workbook_breakdown(file_path, by_unit=True):
+    """
+    quarterly_breakdown of a workbook's complaints and all its order sheets.
+
+    Answered from the aggregate cube, which is first brought up to date
+    (a no-op while the workbook is unchanged); computed once per run.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, by_unit)
+    if key not in _breakdowns:
+        update_cube(file_path)
+        _breakdowns[key] = cube_breakdown(load_cube(cube_folder(file_path)), by_unit)
+    return _breakdowns[key]
+
+def quarter_slice(breakdown, fiscal_year, quarter):
+    """Per-unit rows of a by_unit breakdown for one quarter (empty if the quarter has no data)."""
+    in_quarter = ((breakdown.index.get_level_values('FY') == fiscal_year) &
+                  (breakdown.index.get_level_values('Quarter') == quarter))
+    return breakdown[in_quarter].droplevel(['FY', 'Quarter'])
+
+def quarter_totals(breakdown, fiscal_year, quarter):
+    """The row of a by_unit=False breakdown for one quarter (zeros if the quarter has no data)."""
+    return breakdown.reindex(pd.MultiIndex.from_tuples([(fiscal_year, quarter)])).fillna(0).iloc[0]
+
+def complaints_by_unit(breakdown, fiscal_year, quarter):
+    """Number of complaints per Cost Centre in a quarter of a by_unit breakdown (Cost Centres with any)."""
+    units = quarter_slice(breakdown, fiscal_year, quarter)
+    units = units[units['Complaints'] > 0]
+    return pd.DataFrame({'Cost Centre': units.index, 'Number of Complaints': units['Complaints'].to_numpy()})
+
+def order_counts(breakdown, fiscal_year, quarter):
+    """Unique orders and unique products ordered in a quarter of a by_unit=False breakdown, as one row."""
+    totals = quarter_totals(breakdown, fiscal_year, quarter)
+    return pd.DataFrame({
+        'Unique Orders': [int(totals['Unique Orders'])],
+        'Unique Products Ordered': [int(totals['Unique Products Ordered'])]
+    })
+
+def complaint_summary(file_path, fiscal_year, quarter):
+    """complaints_by_unit for a workbook (see workbook_breakdown)."""
+    return complaints_by_unit(workbook_breakdown(file_path), fiscal_year, quarter)
+
+def order_summary(file_path, fiscal_year, quarter):
+    """order_counts for a workbook (see workbook_breakdown)."""
+    return order_counts(workbook_breakdown(file_path, by_unit=False), fiscal_year, quarter)
@@ -0,0 +1,166 @@
+# complaints_cube.py
+import json
+import os
+import pandas as pd
+from atomic_files import atomic_path, write_json
+from fiscal_calendar import add_fiscal_periods
+from workbook_cache import COMPLAINTS_SHEET, ORDERS_SHEET_PREFIX, load_sheet, sheet_names
+
+CUBE_DIR = "_complaints_cube"
+STATE_FILE = "_state.json"
+# Bumped whenever the ingested rows change shape; a cube of another version is rebuilt
+CUBE_FORMAT = 3
+PERIOD_KEYS = ['FY', 'Quarter', 'Month']
+
+# Cube tables: their dimension columns and the row-count measure each cell holds
+CUBE_TABLES = {
+    'complaints': (PERIOD_KEYS + ['Cost Centre', 'Problem Sub-Type', 'Simple Product Code'], 'Complaints'),
+    'orders': (PERIOD_KEYS + ['Business Unit', 'Order No'], 'Order Lines'),
+    'items': (PERIOD_KEYS + ['Business Unit', 'Item'], 'Order Lines'),  # Item is cleaned on load
+}
+
+# Cubes already loaded by this process, keyed by folder and state
+_cubes = {}
+
+def cube_folder(file_path):
+    """Default cube location, next to the workbook."""
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), CUBE_DIR)
+
+def label_periods(df, date_column):
+    """Add FY, Quarter and Month ('2024-03') columns as plain strings."""
+    df = add_fiscal_periods(df, date_column)
+    df['FY'] = df['FY'].astype(object)
+    df['Quarter'] = df['Quarter'].astype(object)
+    df['Month'] = df[date_column].dt.to_period('M').astype(str).where(df[date_column].notna())
+    return df
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False)
+
+def row_occurrences(hashes):
+    """Occurrence number of each row among the rows with the same hash (0 for the first copy)."""
+    return hashes.groupby(hashes.to_numpy()).cumcount()
+
+def rows_removed(hashes, seen):
+    """Whether rows were ingested that the workbook no longer has (deleted, or edited into another row)."""
+    if not len(seen):
+        return False
+    current = hashes.value_counts().reindex(seen.index, fill_value=0)
+    return bool((seen > current).any())
+
+def unseen_rows(df, hashes, seen):
+    """
+    Rows of `df` not ingested yet, and the updated seen-row counts.
+
+    Rows are identified by a hash of their content. Identical rows are
+    told apart by occurrence, so a repeated row is new only beyond the
+    number of copies already seen.
+    """
+    occurrence = row_occurrences(hashes)
+    already = hashes.map(seen).fillna(0).astype('int64') if len(seen) else 0
+    new = (occurrence >= already).to_numpy()
+    return df[new], hashes.value_counts().rename_axis('hash').rename('count')
+
+def aggregate(rows, table):
+    keys, measure = CUBE_TABLES[table]
+    return rows.groupby(keys, dropna=False, observed=True).size().rename(measure).reset_index()
+
+def merge_cells(existing, new, table):
+    """Add new cell counts into an existing cube table."""
+    if existing is None or existing.empty:
+        return new
+    keys, measure = CUBE_TABLES[table]
+    return pd.concat([existing, new]).groupby(keys, dropna=False, observed=True)[measure].sum().reset_index()
+
+def read_table(folder, name):
+    path = os.path.join(folder, f"{name}.parquet")
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+def write_table(folder, name, df):
+    path = os.path.join(folder, f"{name}.parquet")
+    with atomic_path(path) as tmp_path:
+        df.to_parquet(tmp_path, index=False)
+
+def read_state(folder):
+    path = os.path.join(folder, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def read_seen(folder, source):
+    seen = read_table(folder, f"_seen_{source}")
+    return seen.set_index('hash')['count'] if seen is not None else pd.Series(dtype='int64')
+
+def update_cube(file_path, folder=None, rebuild=False):
+    """
+    Bring the cube up to date with the workbook; returns the number of new rows ingested.
+
+    Nothing is read when the workbook is unchanged since the last update.
+    Otherwise only complaint and order rows not seen before are aggregated
+    and added to the existing cells. If rows seen before were edited or
+    removed in the workbook, the cube is rebuilt from scratch instead.
+    """
+    folder = folder or cube_folder(file_path)
+    os.makedirs(folder, exist_ok=True)
+    stat = os.stat(file_path)
+    version = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    state = read_state(folder)
+    if not rebuild and state.get('workbook') == version and state.get('format') == CUBE_FORMAT:
+        return 0
+    # Rows seen by a cube of another format hash differently, so start over
+    rebuild = rebuild or state.get('format') != CUBE_FORMAT
+
+    complaints = load_sheet(file_path, COMPLAINTS_SHEET)
+    orders = pd.concat([load_sheet(file_path, name) for name in sheet_names(file_path)
+                        if name.startswith(ORDERS_SHEET_PREFIX)], ignore_index=True)
+    sources = {'complaints': (complaints, 'Case Created Date', ['complaints']),
+               'orders': (orders, 'Order Date', ['orders', 'items'])}
+
+    hashes = {source: row_hashes(rows) for source, (rows, _, _) in sources.items()}
+    if not rebuild and any(rows_removed(hashes[source], read_seen(folder, source)) for source in sources):
+        print("Rows were edited or removed in the workbook; rebuilding the complaints cube.")
+        rebuild = True
+    if rebuild:
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+
+    added = 0
+    for source, (rows, date_column, tables) in sources.items():
+        rows, seen = unseen_rows(rows, hashes[source], read_seen(folder, source))
+        added += len(rows)
+        if not rows.empty:
+            rows = label_periods(rows, date_column)
+            for table in tables:
+                write_table(folder, table, merge_cells(read_table(folder, table), aggregate(rows, table), table))
+        write_table(folder, f"_seen_{source}", seen.reset_index())
+
+    write_json(os.path.join(folder, STATE_FILE), {'workbook': version, 'format': CUBE_FORMAT})
+    print(f"Complaints cube updated: {added} new row(s).")
+    return added
+
+def load_cube(folder):
+    """The cube tables as {name: DataFrame}, read once per cube version."""
+    key = (folder, json.dumps(read_state(folder), sort_keys=True))
+    if key not in _cubes:
+        _cubes[key] = {name: read_table(folder, name) for name in CUBE_TABLES}
+    return _cubes[key]
+
+def query(cube, table, by=(), where=None, distinct=None):
+    """
+    Drill down into one cube table.
+
+    `where` maps dimension names to a value or a list of values, `by` lists
+    the dimensions to group on. Returns the summed row counts, or the number
+    of distinct `distinct` values (e.g. 'Order No') per group.
+    """
+    df = cube[table]
+    if df is None:
+        return None
+    for column, value in (where or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        df = df[df[column].isin(values)]
+    measure = CUBE_TABLES[table][1]
+    if distinct:
+        return df.groupby(list(by), observed=True)[distinct].nunique() if by else df[distinct].nunique()
+    return df.groupby(list(by), observed=True)[measure].sum() if by else df[measure].sum()
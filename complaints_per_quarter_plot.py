@@ -1,34 +1,21 @@
 
-import pandas as pd
 import matplotlib.pyplot as plt
+from workbook_cache import load_sheet
+from fiscal_calendar import QUARTERS
+from complaints_breakdown import quarter_totals, quarterly_breakdown
 
 def load_data(file_path, sheet_name):
-    return pd.read_excel(file_path, sheet_name=sheet_name)
-
-def filter_data_by_fy_and_quarter(df, date_column, fiscal_year, quarter):
-    quarter_ranges = {
-        'Q1': ('03-01', '05-31'),
-        'Q2': ('06-01', '08-31'),
-        'Q3': ('09-01', '11-30'),
-        'Q4': ('12-01', '02-28')
-    }
-    start_month, end_month = quarter_ranges[quarter]
-    fy_map = {'F2022': ('2021', '2022'), 'F2023': ('2022', '2023'), 'F2024': ('2023', '2024'), 'F2025': ('2024', '2025')}
-    fiscal_year_start, fiscal_year_end = fy_map[fiscal_year]
-    df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
-    start_date = f"{fiscal_year_start}-{start_month}"
-    end_date = f"{fiscal_year_end}-{end_month}" if quarter == 'Q4' else f"{fiscal_year_start}-{end_month}"
-    return df[(df[date_column] >= start_date) & (df[date_column] <= end_date)]
+    return load_sheet(file_path, sheet_name)
 
 def count_complaints_by_quarter(complaints_df, fiscal_year, max_quarter):
-    quarters = ['Q1', 'Q2', 'Q3', 'Q4']
+    # One grouped pass over all complaints, then read off each quarter
+    breakdown = quarterly_breakdown(complaints_df, by_unit=False)
     result = {}
-    for quarter in quarters:
-        if quarters.index(quarter) > quarters.index(max_quarter):
+    for quarter in QUARTERS:
+        if QUARTERS.index(quarter) > QUARTERS.index(max_quarter):
             result[quarter] = None
         else:
-            filtered = filter_data_by_fy_and_quarter(complaints_df, 'Case Created Date', fiscal_year, quarter)
-            result[quarter] = filtered.shape[0]
+            result[quarter] = int(quarter_totals(breakdown, fiscal_year, quarter)['Complaints'])
     return result
 
 def plot_complaints_per_quarter(complaints_per_quarter, fiscal_year):
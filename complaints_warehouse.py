@@ -0,0 +1,182 @@
+# complaints_warehouse.py
+import argparse
+import os
+import sqlite3
+import pandas as pd
+from complaints_cube import row_hashes, row_occurrences
+from fiscal_calendar import get_fiscal_quarter_dates
+from workbook_cache import COMPLAINTS_SHEET, ORDERS_SHEET_PREFIX, load_sheet, sheet_names
+
+# Sheet columns and the table columns they are stored in
+COMPLAINT_FIELDS = {'Case Created Date': 'CaseCreatedDate', 'Cost Centre': 'CostCentre',
+                    'Problem Sub-Type': 'ProblemSubType', 'Simple Product Code': 'SimpleProductCode'}
+ORDER_FIELDS = {'Order Date': 'OrderDate', 'Order No': 'OrderNo', 'Item': 'Item',
+                'Business Unit': 'BusinessUnit'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Complaint (
+    RowKey TEXT PRIMARY KEY,
+    CaseCreatedDate TEXT,
+    CostCentre TEXT,
+    ProblemSubType TEXT,
+    SimpleProductCode TEXT
+);
+CREATE TABLE IF NOT EXISTS OrderLine (
+    RowKey TEXT PRIMARY KEY,
+    OrderDate TEXT,
+    OrderNo TEXT,
+    Item TEXT,
+    BusinessUnit TEXT
+);
+CREATE TABLE IF NOT EXISTS Ingest (
+    Workbook TEXT PRIMARY KEY,
+    MTimeNs INTEGER,
+    Size INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_complaint_date ON Complaint (CaseCreatedDate);
+CREATE INDEX IF NOT EXISTS idx_complaint_cost_centre ON Complaint (CostCentre, CaseCreatedDate);
+CREATE INDEX IF NOT EXISTS idx_order_date ON OrderLine (OrderDate);
+CREATE INDEX IF NOT EXISTS idx_order_no ON OrderLine (OrderNo);
+"""
+
+# Dates are stored as ISO text, so range filters compare them as strings
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Bumped whenever the schema or the stored rows change; a warehouse of another version is reloaded
+WAREHOUSE_FORMAT = 2
+
+def warehouse_path(file_path):
+    """Default database location: next to the workbook, with a .db extension."""
+    return os.path.splitext(os.path.abspath(file_path))[0] + ".db"
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != WAREHOUSE_FORMAT:
+        # Rows stored by another format are typed and keyed differently, so start over
+        conn.executescript("DROP TABLE IF EXISTS Complaint; DROP TABLE IF EXISTS OrderLine; "
+                           "DROP TABLE IF EXISTS Ingest;")
+        conn.execute(f"PRAGMA user_version = {WAREHOUSE_FORMAT}")
+    conn.executescript(SCHEMA)
+    return conn
+
+def row_keys(df):
+    """
+    Stable key per row: the aggregate cube's content hash plus occurrence
+    number, so identical rows are kept apart and reloading the same rows is
+    a no-op.
+    """
+    hashes = row_hashes(df)
+    occurrence = row_occurrences(hashes)
+    return [f"{h:016x}-{n}" for h, n in zip(hashes.to_numpy(), occurrence.to_numpy())]
+
+def table_rows(df, fields):
+    """Rows ready for executemany: key first, then the fields in table order, with NULL for missing."""
+    df = df[list(fields)]
+    columns = [row_keys(df)]
+    for col in fields:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime(DATE_FORMAT)
+        values = values.astype(object)
+        columns.append(values.where(values.notna(), None).tolist())
+    return list(zip(*columns))
+
+def upsert(conn, table, rows, columns):
+    """
+    Insert rows not stored yet and delete stored rows the workbook no longer has.
+
+    Returns (inserted, deleted).
+    """
+    placeholders = ", ".join("?" * (len(columns) + 1))
+    before = conn.total_changes
+    conn.executemany(f"INSERT INTO {table} (RowKey, {', '.join(columns)}) VALUES ({placeholders}) "
+                     "ON CONFLICT(RowKey) DO NOTHING", rows)
+    inserted = conn.total_changes - before
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS Incoming (RowKey TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM Incoming")
+    conn.executemany("INSERT OR IGNORE INTO Incoming VALUES (?)", [(row[0],) for row in rows])
+    before = conn.total_changes
+    conn.execute(f"DELETE FROM {table} WHERE RowKey NOT IN (SELECT RowKey FROM Incoming)")
+    return inserted, conn.total_changes - before
+
+def ingest(file_path, db_path=None, force=False):
+    """
+    Load RD_All_Complaints and every RD_Orders sheet into the warehouse.
+
+    Loads are idempotent: rows already stored are left alone, new rows are
+    inserted and rows gone from the workbook are deleted, all in one
+    transaction. An unchanged workbook (same mtime and size) is skipped.
+    """
+    db_path = db_path or warehouse_path(file_path)
+    stat = os.stat(file_path)
+    conn = connect(db_path)
+    try:
+        stored = conn.execute("SELECT MTimeNs, Size FROM Ingest WHERE Workbook = ?",
+                              (os.path.abspath(file_path),)).fetchone()
+        if not force and stored == (stat.st_mtime_ns, stat.st_size):
+            return db_path
+
+        complaints = load_sheet(file_path, COMPLAINTS_SHEET)
+        orders = pd.concat([load_sheet(file_path, name) for name in sheet_names(file_path)
+                            if name.startswith(ORDERS_SHEET_PREFIX)], ignore_index=True)
+        with conn:
+            added, removed = upsert(conn, "Complaint", table_rows(complaints, COMPLAINT_FIELDS),
+                                    list(COMPLAINT_FIELDS.values()))
+            print(f"Complaints: {added} inserted, {removed} removed.")
+            added, removed = upsert(conn, "OrderLine", table_rows(orders, ORDER_FIELDS),
+                                    list(ORDER_FIELDS.values()))
+            print(f"Order lines: {added} inserted, {removed} removed.")
+            conn.execute("INSERT OR REPLACE INTO Ingest (Workbook, MTimeNs, Size) VALUES (?, ?, ?)",
+                         (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size))
+    finally:
+        conn.close()
+    return db_path
+
+def quarter_range(fiscal_year, quarter):
+    """Half-open [start, end) ISO bounds of a fiscal quarter for indexed range queries."""
+    start, end = get_fiscal_quarter_dates(fiscal_year, quarter)
+    return start.strftime(DATE_FORMAT), (end + pd.Timedelta(days=1)).strftime(DATE_FORMAT)
+
+def query(db_path, sql, params=()):
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+def quarter_totals(db_path, fiscal_year, quarter):
+    """Complaints and unique orders in a fiscal quarter."""
+    bounds = quarter_range(fiscal_year, quarter)
+    totals = query(db_path, """
+        SELECT (SELECT COUNT(*) FROM Complaint
+                WHERE CaseCreatedDate >= ? AND CaseCreatedDate < ?) AS Complaints,
+               (SELECT COUNT(DISTINCT OrderNo) FROM OrderLine
+                WHERE OrderDate >= ? AND OrderDate < ?) AS UniqueOrders
+    """, bounds + bounds)
+    return int(totals.at[0, 'Complaints']), int(totals.at[0, 'UniqueOrders'])
+
+def complaints_by_unit(db_path, fiscal_year, quarter):
+    """Number of complaints per Cost Centre in a fiscal quarter."""
+    return query(db_path, """
+        SELECT CostCentre AS "Cost Centre", COUNT(*) AS "Number of Complaints" FROM Complaint
+        WHERE CaseCreatedDate >= ? AND CaseCreatedDate < ? AND CostCentre IS NOT NULL
+        GROUP BY CostCentre ORDER BY CostCentre
+    """, quarter_range(fiscal_year, quarter))
+
+def orders_by_unit(db_path, fiscal_year, quarter):
+    """Unique orders per Business Unit in a fiscal quarter."""
+    return query(db_path, """
+        SELECT BusinessUnit AS "Business Unit", COUNT(DISTINCT OrderNo) AS "Unique Orders" FROM OrderLine
+        WHERE OrderDate >= ? AND OrderDate < ? AND BusinessUnit IS NOT NULL
+        GROUP BY BusinessUnit ORDER BY BusinessUnit
+    """, quarter_range(fiscal_year, quarter))
+
+# Example: python complaints_warehouse.py "Complaints and Orders.xlsx"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the complaints and orders workbook into SQLite.")
+    parser.add_argument("workbook", help="path to Complaints and Orders.xlsx")
+    parser.add_argument("--db", help="database path (default: next to the workbook)")
+    parser.add_argument("--force", action="store_true", help="reload even if the workbook is unchanged")
+    args = parser.parse_args()
+
+    print(f"Warehouse ready: {ingest(args.workbook, args.db, force=args.force)}")
@@ -1,12 +1,28 @@
 # create_database.py
+import argparse
+import hashlib
+import os
 import sqlite3
+import tempfile
+import time
+import pandas as pd
 
 # Database file path (update this path as needed)
 db_path = r"path\to\your\compendium.db"
 
-def create_database():
+# Compound columns loaded from spreadsheets; CompoundName identifies a compound
+COMPOUND_FIELDS = ['CompoundName', 'SchedulingStatus', 'RegisteredTradeName', 'CompoundType',
+                   'AnimalsTreated', 'CurrentFormulations', 'PharmacologicalClassification',
+                   'PharmacologicalAction', 'Indications', 'DosageDirections', 'WarningsPrecautions',
+                   'ReferenceText', 'ApprovalStatus', 'Approver']
+# Values used for fields a record leaves out, matching the column defaults
+FIELD_DEFAULTS = {'ApprovalStatus': 'approval due'}
+# Rows per executemany call during a bulk upsert
+BATCH_SIZE = 5000
+
+def create_database(path=None):
     """Create the Compound table in the SQLite database if it doesn't exist."""
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(path or db_path)
     cursor = conn.cursor()
 
     # Define the Compound table schema
@@ -33,9 +49,157 @@ def create_database():
         )
     ''')
 
+    # Upserts match compounds by name. Older databases may repeat a name, which rules out
+    # a unique index; those names are reported and get a plain lookup index instead.
+    duplicates = cursor.execute("SELECT CompoundName, COUNT(*) FROM Compound "
+                                "GROUP BY CompoundName HAVING COUNT(*) > 1").fetchall()
+    if duplicates:
+        shown = ", ".join(f"{name} ({count})" for name, count in duplicates[:10])
+        print(f"{len(duplicates)} compound name(s) are stored more than once: {shown}"
+              f"{', ...' if len(duplicates) > 10 else ''}. Imports update every row with a repeated "
+              "name; merge them to restore the unique index on CompoundName.")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_compound_name_lookup ON Compound (CompoundName)")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_compound_name ON Compound (CompoundName)")
+
     conn.commit()
     conn.close()
     print("Database and table created successfully.")
 
-# Call the function
-create_database()
+def is_blank(value):
+    return value is None or (isinstance(value, float) and value != value)  # missing or NaN
+
+def field_value(record, field):
+    value = record.get(field)
+    return FIELD_DEFAULTS.get(field) if is_blank(value) else value
+
+def supplied_fields(record):
+    """The fields a record gives a value for; a blank spreadsheet cell (NaN) counts as not supplied."""
+    return {field: value for field, value in record.items() if not is_blank(value)}
+
+def compound_row(record, stored=None):
+    """
+    Field values of one record in COMPOUND_FIELDS order.
+
+    Fields the record leaves out keep their `stored` value (the compound's
+    current row, in the same order), or their default for a new compound.
+    """
+    return tuple(field_value(record, field) if stored is None or field in record else stored[i]
+                 for i, field in enumerate(COMPOUND_FIELDS))
+
+def content_hash(row):
+    """SHA-256 of a row's field values, taken as the text the TEXT columns store them as."""
+    values = tuple(None if value is None else str(value) for value in row)
+    return hashlib.sha256(repr(values).encode()).hexdigest()
+
+def bulk_upsert_compounds(records, path=None):
+    """
+    Insert or update many compounds in one transaction; returns (inserted, updated, unchanged).
+
+    `records` are dicts (or a DataFrame) keyed by COMPOUND_FIELDS and matched
+    to stored compounds by CompoundName; records without a name are skipped
+    and reported. Only the fields a record supplies are updated; the others
+    keep their stored values, and a blank cell does not count as supplied.
+    Records with the same name are merged, later fields winning. A compound
+    whose merged row hashes the same as its stored values is skipped; the
+    stored side is hashed from the values read back rather than a cached
+    hash, so rows edited by other tools are seen. A changed one is rewritten
+    with its Version bumped and LastModified set to today; a name stored more
+    than once (see create_database) has all its rows rewritten. Rows are
+    written with batched executemany calls in WAL mode.
+    """
+    if isinstance(records, pd.DataFrame):
+        records = records.to_dict('records')
+    merged = {}
+    nameless = []
+    for number, record in enumerate(records, start=1):
+        record = supplied_fields(record)
+        name = record.get('CompoundName')
+        if name is None or not str(name).strip():
+            nameless.append(number)
+            continue
+        merged.setdefault(name, {}).update(record)
+    if nameless:
+        shown = ", ".join(map(str, nameless[:10])) + (", ..." if len(nameless) > 10 else "")
+        print(f"Skipped {len(nameless)} record(s) without a CompoundName: {shown}")
+
+    conn = sqlite3.connect(path or db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Stored rows by name, oldest first; partial records merge over the newest
+        stored = {}
+        for row in conn.execute(f"SELECT {', '.join(COMPOUND_FIELDS)} FROM Compound ORDER BY CompoundID"):
+            stored.setdefault(row[0], []).append(row)
+        new, changed = [], []
+        for name, record in merged.items():
+            if name not in stored:
+                new.append(compound_row(record))
+                continue
+            row = compound_row(record, stored[name][-1])
+            digest = content_hash(row)
+            if any(content_hash(stored_row) != digest for stored_row in stored[name]):
+                changed.append(row[1:] + row[:1])
+
+        insert_sql = (f"INSERT INTO Compound ({', '.join(COMPOUND_FIELDS)}) "
+                      f"VALUES ({', '.join('?' * len(COMPOUND_FIELDS))})")
+        update_sql = (f"UPDATE Compound SET {', '.join(f'{col} = ?' for col in COMPOUND_FIELDS[1:])}, "
+                      "Version = Version + 1, LastModified = CURRENT_DATE WHERE CompoundName = ?")
+        with conn:
+            for sql, rows in ((insert_sql, new), (update_sql, changed)):
+                for start in range(0, len(rows), BATCH_SIZE):
+                    conn.executemany(sql, rows[start:start + BATCH_SIZE])
+    finally:
+        conn.close()
+
+    unchanged = len(merged) - len(new) - len(changed)
+    print(f"Compounds: {len(new)} inserted, {len(changed)} updated, {unchanged} unchanged.")
+    return len(new), len(changed), unchanged
+
+def import_spreadsheet(file_path, path=None, sheet_name=0):
+    """Bulk upsert the compounds in a CSV or Excel file whose headers are Compound column names."""
+    if file_path.lower().endswith(".csv"):
+        df = pd.read_csv(file_path, dtype=str)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
+    df = df[[col for col in df.columns if col in COMPOUND_FIELDS]]
+    return bulk_upsert_compounds(df, path)
+
+def synthetic_compounds(count, revision=0):
+    """Generated compound records for benchmarking; `revision` changes every tenth one."""
+    return [{'CompoundName': f"Compound {i:06d}",
+             'SchedulingStatus': f"S{i % 7 + 1}",
+             'RegisteredTradeName': f"Trade {i}",
+             'CompoundType': ("Antibiotic", "Antiparasitic", "Vaccine", "Anaesthetic")[i % 4],
+             'AnimalsTreated': "Cattle, sheep, goats",
+             'Indications': f"Indication text for compound {i}" + (f" (rev {revision})" if i % 10 == 0 else ""),
+             'DosageDirections': "1 ml per 10 kg body weight",
+             'ReferenceText': "Reference " * 20}
+            for i in range(count)]
+
+def benchmark(count=100000):
+    """Time a cold bulk load, a reload with nothing changed and a reload with 10% changed."""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "benchmark.db")
+        create_database(path)
+        for label, records in [("initial load", synthetic_compounds(count)),
+                               ("unchanged reload", synthetic_compounds(count)),
+                               ("10% changed", synthetic_compounds(count, revision=1))]:
+            start = time.perf_counter()
+            bulk_upsert_compounds(records, path)
+            print(f"{label}: {count} compounds in {time.perf_counter() - start:.2f}s")
+
+# Example: python create_database.py compounds.xlsx  (or --benchmark 100000)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the compendium database and import compounds.")
+    parser.add_argument("spreadsheets", nargs="*", help="CSV or Excel files of compounds to upsert")
+    parser.add_argument("--db", default=db_path, help="database file path")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="time bulk upserts of N synthetic compounds")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        create_database(args.db)
+        for spreadsheet in args.spreadsheets:
+            import_spreadsheet(spreadsheet, args.db)
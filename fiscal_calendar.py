@@ -0,0 +1,65 @@
+# fiscal_calendar.py
+import pandas as pd
+
+# Fiscal years run March to February and are named after the year they end in (F2025 = Mar 2024 - Feb 2025)
+FY_START_MONTH = 3
+QUARTERS = ['Q1', 'Q2', 'Q3', 'Q4']
+
+def fiscal_year_label(end_year):
+    return f"F{int(end_year)}"
+
+def fiscal_year_end(fiscal_year):
+    """Calendar year a fiscal year label ends in ('F2025' -> 2025)."""
+    return int(str(fiscal_year).lstrip("Ff"))
+
+def current_fiscal_year(today=None):
+    today = pd.Timestamp(today) if today is not None else pd.Timestamp.today()
+    return fiscal_year_label(today.year + (today.month >= FY_START_MONTH))
+
+def get_fiscal_quarter_dates(fiscal_year, quarter):
+    """
+    Returns the first and last day of a fiscal quarter (Q4 ends on Feb 28 or 29).
+    """
+    start = pd.Timestamp(fiscal_year_end(fiscal_year) - 1, FY_START_MONTH, 1)
+    start += pd.DateOffset(months=3 * QUARTERS.index(quarter))
+    end = start + pd.DateOffset(months=3) - pd.Timedelta(days=1)
+    return start, end
+
+def fiscal_periods(dates):
+    """
+    Labels a whole date column with fiscal year and quarter in one vectorized pass.
+
+    Returns a DataFrame with categorical 'FY' ('F2025') and 'Quarter' ('Q1')
+    columns on the same index; unparseable dates get missing labels.
+    """
+    dates = pd.to_datetime(dates, errors='coerce')
+    month = dates.dt.month
+    end_year = dates.dt.year + (month >= FY_START_MONTH)
+    labels = {year: fiscal_year_label(year) for year in end_year.dropna().unique()}
+    quarter_codes = ((month - FY_START_MONTH) % 12 // 3).fillna(-1).astype(int)
+    return pd.DataFrame({
+        'FY': pd.Categorical(end_year.map(labels), categories=sorted(labels.values())),
+        'Quarter': pd.Categorical.from_codes(quarter_codes, categories=QUARTERS),
+    }, index=dates.index)
+
+def add_fiscal_periods(df, date_column):
+    """Returns a copy of `df` with its date column parsed and 'FY'/'Quarter' columns added."""
+    dates = pd.to_datetime(df[date_column], errors='coerce')
+    periods = fiscal_periods(dates)
+    # Assigned by position, so a repeated index cannot multiply rows as a join would
+    return df.assign(**{date_column: dates, 'FY': periods['FY'].array,
+                        'Quarter': periods['Quarter'].array})
+
+def filter_data_by_fy_and_quarter(df, date_column, fiscal_year, quarter):
+    """
+    Returns the rows of `df` dated within the given fiscal quarter.
+
+    Whole days are compared, so times on the quarter's last day are kept.
+    The input frame is not modified.
+    """
+    start, end = get_fiscal_quarter_dates(fiscal_year, quarter)
+    dates = df[date_column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors='coerce')
+        df = df.assign(**{date_column: dates})
+    return df[(dates >= start) & (dates < end + pd.Timedelta(days=1))]
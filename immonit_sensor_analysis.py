@@ -1,19 +1,16 @@
-import requests
 import json
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+from sensor_api import get_client
+from sensor_data_processor import parse_custom_dates
 
 # Retrieve the list of available sensors from the iMonnit API
 def sensor_list(api_key, secret_key):
     print("Fetching sensor list...")
-    url = "https://www.imonnit.com/json/SensorListFull"
-    headers = {
-        "APIKeyID": api_key,
-        "APISecretKey": secret_key
-    }
     
-    response = requests.post(url, headers=headers)
+    # Reuse the pooled keep-alive session shared with sensor_api
+    response = get_client(api_key, secret_key).post("SensorListFull")
     
     if response.status_code == 200:
         data = response.json()
@@ -31,19 +28,13 @@ def sensor_list(api_key, secret_key):
 # Fetch historical data for a given sensor within a date range
 def sensor_data(sensor_id, from_date, to_date, api_key, secret_key):
     print(f"Fetching data for sensor {sensor_id} from {from_date} to {to_date}...")
-    url = "https://www.imonnit.com/json/SensorDataMessages"
-    headers = {
-        "APIKeyID": api_key,
-        "APISecretKey": secret_key
-    }
-    
     params = {
         "sensorID": sensor_id,
         "fromDate": from_date,
         "toDate": to_date
     }
     
-    response = requests.post(url, headers=headers, data=params)
+    response = get_client(api_key, secret_key).post("SensorDataMessages", data=params)
     
     if response.status_code == 200:
         print(f"Successfully retrieved data for sensor {sensor_id}.")
@@ -54,17 +45,9 @@ def sensor_data(sensor_id, from_date, to_date, api_key, secret_key):
         print(response.text)
         return []
 
-# Parse iMonnit's custom date format (/Date(...)/) into Python datetime
-def parse_custom_date(date_str):
-    """Convert `/Date(...)` format to datetime."""
-    if date_str.startswith('/Date('):
-        timestamp = int(date_str[6:-2]) / 1000  # Convert milliseconds to seconds
-        return datetime.utcfromtimestamp(timestamp)
-    return pd.NaT  # Return NaT for unrecognized formats
-
 # Retrieve and store monthly sensor data for multiple sensors
 def get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder):
-    all_data = pd.DataFrame()
+    sensor_frames = []
     start_date = datetime(year, month, 1)
     next_month = start_date.replace(day=28) + timedelta(days=4)
     end_date = next_month - timedelta(days=next_month.day)
@@ -102,13 +85,15 @@ def get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder
                 print(f"No data retrieved for sensor {sensor_id}.")
                 continue
         
-        # Append to the combined dataset
+        # Collect for the combined dataset
         if not sensor_df.empty:
             sensor_df['SensorID'] = sensor_id  # Ensure SensorID is present
-            all_data = pd.concat([all_data, sensor_df], ignore_index=True)
+            sensor_frames.append(sensor_df)
         
         print(f"Completed data retrieval for sensor {sensor_id}.")
     
+    # Concatenate once; appending inside the loop re-copies everything per sensor
+    all_data = pd.concat(sensor_frames, ignore_index=True) if sensor_frames else pd.DataFrame()
     print(f"\nAll data for the month retrieved. Total records: {len(all_data)}.")
     return all_data
 
@@ -133,7 +118,7 @@ def process_sensor_data(monthly_data, limits_filepath, output_folder, year, mont
     monthly_data = monthly_data.dropna(subset=['PlotValue'])
 
     # Convert message date to datetime
-    monthly_data['timestamp'] = monthly_data['MessageDate'].apply(parse_custom_date)
+    monthly_data['timestamp'] = parse_custom_dates(monthly_data['MessageDate'])
 
     # Map limits to each sensor reading
     monthly_data['lim_min'] = monthly_data['SensorID'].map(lambda x: limits_dict.at[x, 'lim_min'] if x in limits_dict.index else None)
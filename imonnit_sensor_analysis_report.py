@@ -1,16 +1,36 @@
+import argparse
+import json
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from fpdf import FPDF
+from atomic_files import write_json
+from run_batch_analysis import parse_month
+from workbook_cache import file_sha256
 
 # Define the folder path where processed CSVs and output PDFs will be saved
 folder_path = r"C:\Path\To\Your\Output\Folder"
 
+# Per-folder record of the CSV each PDF was rendered from
+MANIFEST_FILE = "_report_manifest.json"
+REPORT_CSV_PATTERN = re.compile(r"^processed_analysis_(\d{4})_(\d{2})\.csv$")
+
+def as_text(series):
+    """A column as a list of str(value), like a per-cell str() (NaN becomes 'nan')."""
+    return series.to_numpy(dtype=object).astype(str).tolist()
+
 # Function to calculate dynamic column widths for the PDF table
 def calculate_col_widths(dataframe, pdf, padding=2, last_column_extra=0):
     """
     Dynamically calculates column widths based on content length so that
     the table fits nicely in an A4 landscape PDF.
 
+    Each distinct character is measured once with the current font, and
+    within a column only the distinct values long enough to beat the widest
+    one found so far are measured.
+
     Args:
         dataframe (pd.DataFrame): Data to be displayed in the table.
         pdf (FPDF): PDF object.
@@ -23,13 +43,22 @@ def calculate_col_widths(dataframe, pdf, padding=2, last_column_extra=0):
     total_width = 277  # A4 landscape width (297mm) minus 20mm for margins
     usable_width = total_width - last_column_extra
     col_widths = []
+    char_widths = {}
+
+    def string_width(text):
+        for char in set(text).difference(char_widths):
+            char_widths[char] = pdf.get_string_width(char)
+        return sum(char_widths[char] for char in text)
 
     for col in dataframe.columns[:-1]:  # Exclude the last column temporarily
-        max_width = pdf.get_string_width(str(col)) + padding  # Start with header width
-        for value in dataframe[col]:
-            cell_width = pdf.get_string_width(str(value)) + padding
-            max_width = max(max_width, cell_width)
-        col_widths.append(max_width)
+        max_width = string_width(str(col))  # Start with header width
+        values = sorted(set(as_text(dataframe[col])), key=len, reverse=True)
+        widest_char = max((string_width(char) for char in set("".join(values))), default=0)
+        for value in values:
+            if len(value) * widest_char <= max_width:
+                break  # No shorter value can be wider
+            max_width = max(max_width, string_width(value))
+        col_widths.append(max_width + padding)
 
     # Scale column widths if they exceed the usable page width
     total_used_width = sum(col_widths)
@@ -38,6 +67,13 @@ def calculate_col_widths(dataframe, pdf, padding=2, last_column_extra=0):
     col_widths.append(last_column_extra)  # Add extra width for the last column
     return col_widths
 
+def draw_header(pdf, columns, col_widths):
+    pdf.set_font("Arial", style="B", size=8)
+    for width, col in zip(col_widths, columns):
+        pdf.cell(width, 10, col, border=1, align="C")
+    pdf.ln()
+    pdf.set_font("Arial", size=8)
+
 # Function to draw a table in the PDF
 def draw_table(pdf, dataframe, col_widths):
     """
@@ -49,28 +85,20 @@ def draw_table(pdf, dataframe, col_widths):
         dataframe (pd.DataFrame): Data to draw.
         col_widths (list): Column widths.
     """
-    # Draw table headers
-    pdf.set_font("Arial", style="B", size=8)
-    for i, col in enumerate(dataframe.columns):
-        pdf.cell(col_widths[i], 10, col, border=1, align="C")
-    pdf.ln()
+    columns = list(dataframe.columns)
+    draw_header(pdf, columns, col_widths)
 
-    # Draw table rows
-    pdf.set_font("Arial", size=8)
-    for _, row in dataframe.iterrows():
+    # Stringify every column once, then draw rows from plain tuples
+    for row in zip(*(as_text(dataframe[col]) for col in columns)):
         if pdf.get_y() > 180:  # Add new page if content overflows
             pdf.add_page()
-            pdf.set_font("Arial", style="B", size=8)
-            for i, col in enumerate(dataframe.columns):
-                pdf.cell(col_widths[i], 10, col, border=1, align="C")
-            pdf.ln()
-            pdf.set_font("Arial", size=8)
-        for i, col in enumerate(dataframe.columns):
-            pdf.cell(col_widths[i], 10, str(row[col]), border=1)
+            draw_header(pdf, columns, col_widths)
+        for width, value in zip(col_widths, row):
+            pdf.cell(width, 10, value, border=1)
         pdf.ln()
 
 # Function to convert the processed CSV file into a formatted PDF report
-def csv_to_pdf(year, month):
+def csv_to_pdf(year, month, folder=None):
     """
     Loads processed sensor data from a CSV file and generates a
     professionally formatted PDF report with tables.
@@ -78,21 +106,26 @@ def csv_to_pdf(year, month):
     Args:
         year (int): Year of the report.
         month (int): Month of the report.
+        folder (str): Folder holding the CSV and receiving the PDF (defaults to folder_path).
+
+    Returns:
+        str: Path of the saved PDF, or None if it could not be generated.
     """
+    folder = folder or folder_path
     filename = f"processed_analysis_{year}_{month:02d}.csv"
-    file_path = os.path.join(folder_path, filename)
+    file_path = os.path.join(folder, filename)
 
     # Verify if CSV file exists
     if not os.path.exists(file_path):
-        print(f"File '{filename}' not found in folder '{folder_path}'.")
-        return
+        print(f"File '{filename}' not found in folder '{folder}'.")
+        return None
 
     # Load the CSV data into a DataFrame
     try:
         df = pd.read_csv(file_path)
     except Exception as e:
         print(f"Error loading CSV: {e}")
-        return
+        return None
 
     # Remove 'SensorID' column and sort by 'SensorName'
     if 'SensorID' in df.columns:
@@ -100,15 +133,18 @@ def csv_to_pdf(year, month):
     if 'SensorName' in df.columns:
         df = df.sort_values(by='SensorName')
 
-    # Format numeric columns to 1 decimal place
+    # Format numeric columns to 1 decimal place, a whole column at a time
     for col in df.select_dtypes(include='number').columns:
-        df[col] = df[col].apply(lambda x: f"{x:.1f}")
+        df[col] = np.char.mod("%.1f", df[col].to_numpy(dtype=float))
 
     # Define columns to be included in the full report
     relevant_columns = [
         'SensorName', 'UOM', 'min', 'max', 'mean', 'avg_out_of_spec', 
         'non_compliant_hours', 'non_compliant_days', 'Compliant Yes/No'
     ]
+    # Reports processed before partial fetches were flagged lack the column
+    if 'Data Complete Yes/No' in df.columns:
+        relevant_columns.insert(-1, 'Data Complete Yes/No')
     df = df[relevant_columns]
 
     # Filter non-compliant sensors for a secondary table
@@ -148,21 +184,121 @@ def csv_to_pdf(year, month):
         draw_table(pdf, non_compliant_df, col_widths_non_compliant)
 
     # Save PDF
-    output_file = os.path.join(folder_path, f"processed_analysis_{year}_{month:02d}.pdf")
+    output_file = os.path.join(folder, f"processed_analysis_{year}_{month:02d}.pdf")
     try:
         pdf.output(output_file)
         print(f"PDF saved successfully: {output_file}")
+        return output_file
     except Exception as e:
         print(f"Error saving PDF: {e}")
+        return None
+
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(folder, manifest):
+    write_json(os.path.join(folder, MANIFEST_FILE), manifest, indent=1, sort_keys=True)
+
+def find_reports(folder, start=None, end=None):
+    """List (year, month) of the processed_analysis CSVs in a folder, optionally within a month range."""
+    months = []
+    for name in os.listdir(folder):
+        match = REPORT_CSV_PATTERN.match(name)
+        if not match:
+            continue
+        year_month = (int(match.group(1)), int(match.group(2)))
+        if (start is None or year_month >= tuple(start)) and (end is None or year_month <= tuple(end)):
+            months.append(year_month)
+    return sorted(months)
+
+def is_current(folder, filename, entry):
+    """Whether the PDF recorded in a manifest entry still matches its CSV.
+
+    A matching mtime and size is trusted; otherwise the CSV is hashed, so a
+    touched but unchanged file is not re-rendered.
+    """
+    pdf_file = os.path.join(folder, filename[:-len(".csv")] + ".pdf")
+    if not entry or not os.path.exists(pdf_file):
+        return False
+    stat = os.stat(os.path.join(folder, filename))
+    if entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+        return True
+    if entry.get('sha256') == file_sha256(os.path.join(folder, filename)):
+        entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        return True
+    return False
+
+def render_report(folder, year, month):
+    """Worker: render one PDF and return the manifest entry of the CSV it was built from."""
+    csv_file = os.path.join(folder, f"processed_analysis_{year}_{month:02d}.csv")
+    stat = os.stat(csv_file)
+    entry = {'sha256': file_sha256(csv_file), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    return entry if csv_to_pdf(year, month, folder) else None
+
+def batch_csv_to_pdf(folders, start=None, end=None, processes=None, force=False):
+    """Render the PDF for every processed_analysis CSV in `folders` on a process pool.
+
+    Reports whose CSV is unchanged since its PDF was rendered are skipped
+    unless `force` is set. `start`/`end` are optional (year, month) bounds.
+    Returns the number of PDFs written.
+    """
+    manifests = {folder: load_manifest(folder) for folder in folders}
+    jobs, skipped = [], 0
+    for folder in folders:
+        for year, month in find_reports(folder, start, end):
+            filename = f"processed_analysis_{year}_{month:02d}.csv"
+            if force or not is_current(folder, filename, manifests[folder].get(filename)):
+                jobs.append((folder, year, month))
+            else:
+                skipped += 1
+    print(f"Rendering {len(jobs)} report(s), {skipped} unchanged.")
+
+    written = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(render_report, *job): job for job in jobs}
+            for future in as_completed(futures):
+                folder, year, month = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"Error rendering {folder} {year}-{month:02d}: {e}")
+                    continue
+                if entry:
+                    manifests[folder][f"processed_analysis_{year}_{month:02d}.csv"] = entry
+                    written += 1
+
+    # Also persists mtimes refreshed by is_current
+    for folder, manifest in manifests.items():
+        save_manifest(folder, manifest)
+    return written
+
+# Example: python imonnit_sensor_analysis_report.py site_a site_b --start 2024-03 --end 2025-02
+# With no folders, prompts for a single month in folder_path as before.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render processed_analysis CSVs to PDF reports.")
+    parser.add_argument("folders", nargs="*", help="folders holding processed_analysis_YYYY_MM.csv files")
+    parser.add_argument("--start", type=parse_month, help="first month, YYYY-MM")
+    parser.add_argument("--end", type=parse_month, help="last month, YYYY-MM")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="re-render reports even if their CSV is unchanged")
+    args = parser.parse_args()
+
+    if args.folders:
+        batch_csv_to_pdf(args.folders, args.start, args.end, processes=args.processes, force=args.force)
+    else:
+        # Prompt user for year and month input
+        year = input("Enter the year (e.g., 2024): ")
+        month = input("Enter the month (e.g., 9 for September): ")
 
-# Prompt user for year and month input
-year = input("Enter the year (e.g., 2024): ")
-month = input("Enter the month (e.g., 9 for September): ")
-
-# Validate user input and run the report generation
-try:
-    year = int(year)
-    month = int(month)
-    csv_to_pdf(year, month)
-except ValueError:
-    print("Invalid input. Please enter numeric values for year and month.")
+        # Validate user input and run the report generation
+        try:
+            year = int(year)
+            month = int(month)
+            csv_to_pdf(year, month)
+        except ValueError:
+            print("Invalid input. Please enter numeric values for year and month.")
@@ -0,0 +1,127 @@
+# run_batch_analysis.py
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sensor_api import BASE_URL, DEFAULT_RATE_LIMIT, get_client
+from sensor_data_retreiver import get_monthly_data, iter_monthly_data
+from sensor_data_processor import (REQUIRED_COLUMNS, load_limits, process_sensor_data,
+                                   process_sensor_data_streaming)
+from sensor_metadata import cached_sensor_metadata
+from sensor_rollups import rollup_report, update_rollups, with_rollups
+
+def month_range(start, end):
+    """List (year, month) pairs from `start` to `end` inclusive, both given as (year, month)."""
+    months = []
+    year, month = start
+    while (year, month) <= tuple(end):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def analyze_month(site, metadata, limits, year, month, rate_limit, streaming=False, rollups=False,
+                  incremental=True):
+    """Worker: retrieve and process one site-month with the site's shared sensor metadata and limits.
+
+    With `incremental`, months cached before they ended are topped up. With
+    `rollups`, the site's hourly/daily rollups are updated and the month's
+    rollup_analysis report is saved from them.
+    """
+    # Each worker process gets its share of the per-host request rate
+    get_client(site['api_key'], site['secret_key'], base_url=site.get('base_url', BASE_URL),
+               rate_limit=rate_limit)
+    output_folder = site['output_folder']
+    sensor_ids = metadata.index.to_numpy()
+
+    print(f"\nStarting {site['name']} {year}-{month:02d}")
+    if streaming:
+        chunks = iter_monthly_data(sensor_ids, year, month, site['api_key'], site['secret_key'],
+                                   output_folder, columns=REQUIRED_COLUMNS, incremental=incremental)
+        if rollups:
+            chunks = with_rollups(chunks, output_folder)
+        processed = process_sensor_data_streaming(chunks, None, output_folder, year, month,
+                                                  limits=limits, metadata=metadata)
+    else:
+        monthly_data = get_monthly_data(sensor_ids, year, month, site['api_key'], site['secret_key'],
+                                        output_folder, columns=REQUIRED_COLUMNS, incremental=incremental)
+        if monthly_data.empty:
+            print(f"No data to process for {site['name']} {year}-{month:02d}.")
+            return None
+        if rollups:
+            update_rollups(monthly_data, output_folder)
+        processed = process_sensor_data(monthly_data, None, output_folder, year, month, limits=limits,
+                                        metadata=metadata)
+
+    if processed is None:
+        return None
+    if rollups:
+        rollup_report(output_folder, year, month, limits=limits)
+    return os.path.join(output_folder, f"processed_analysis_{year}_{month:02d}.csv")
+
+def batch_analysis(sites, start, end, processes=4, streaming=False, rollups=False, incremental=True):
+    """Run the full pipeline for every site and every month from `start` to `end`.
+
+    Each site is a dict with 'name', 'api_key', 'secret_key', 'limits_filepath',
+    'output_folder' and optionally 'base_url'. Sensor metadata (cached in
+    the site's output folder) and limits are loaded once per site, then
+    site-months are fanned out over a process pool. Returns the paths of
+    the processed_analysis_*.csv files written. `incremental` tops up
+    months cached before they ended; `rollups` also maintains the rollups
+    and writes a rollup_analysis report per month.
+    """
+    months = month_range(start, end)
+    print(f"Batch analysis: {len(sites)} site(s) x {len(months)} month(s) on {processes} processes")
+
+    jobs = []
+    for site in sites:
+        os.makedirs(site['output_folder'], exist_ok=True)
+        client = get_client(site['api_key'], site['secret_key'], base_url=site.get('base_url', BASE_URL))
+        metadata = cached_sensor_metadata(site['api_key'], site['secret_key'], site['output_folder'],
+                                          client=client)
+        if metadata.empty:
+            print(f"No sensors found for {site['name']}. Skipping.")
+            continue
+        limits = load_limits(site['limits_filepath'])
+        jobs.extend((site, metadata, limits, year, month) for year, month in months)
+
+    written = []
+    rate_limit = DEFAULT_RATE_LIMIT / max(1, processes)
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as pool:
+        futures = {pool.submit(analyze_month, *job, rate_limit, streaming, rollups, incremental): job
+                   for job in jobs}
+        for future in as_completed(futures):
+            site, _, _, year, month = futures[future]
+            try:
+                path = future.result()
+            except Exception as e:
+                print(f"Error processing {site['name']} {year}-{month:02d}: {e}")
+                continue
+            if path:
+                written.append(path)
+
+    print(f"\nBatch complete: {len(written)} of {len(jobs)} reports written.")
+    return sorted(written)
+
+def parse_month(value):
+    year, month = value.split("-")
+    return int(year), int(month)
+
+# Example: python run_batch_analysis.py sites.json 2024-03 2025-02 --processes 8
+# where sites.json is a list of {"name", "api_key", "secret_key", "limits_filepath", "output_folder"}
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill sensor analyses for a range of months.")
+    parser.add_argument("sites", help="JSON file listing the sites and their API credentials")
+    parser.add_argument("start", type=parse_month, help="first month, YYYY-MM")
+    parser.add_argument("end", type=parse_month, help="last month, YYYY-MM")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--streaming", action="store_true", help="process one sensor at a time")
+    parser.add_argument("--rollups", action="store_true",
+                        help="update the hourly/daily rollups and write rollup_analysis reports")
+    parser.add_argument("--no-incremental", dest="incremental", action="store_false",
+                        help="trust cached months as-is instead of topping up ones cached mid-month")
+    args = parser.parse_args()
+
+    with open(args.sites) as f:
+        sites = json.load(f)
+    batch_analysis(sites, args.start, args.end, processes=args.processes, streaming=args.streaming,
+                   rollups=args.rollups, incremental=args.incremental)
@@ -1,27 +1,58 @@
 # run_full_analysis.py
 import os
-from sensor_api import sensor_list
-from sensor_data_retriever import get_monthly_data
-from sensor_data_processor import process_sensor_data
+from sensor_data_retreiver import get_monthly_data, iter_monthly_data
+from sensor_data_processor import REQUIRED_COLUMNS, process_sensor_data, process_sensor_data_streaming
+from sensor_metadata import DEFAULT_TTL, cached_sensor_metadata
+from sensor_rollups import rollup_report, update_rollups, with_rollups
 
-def full_analysis(api_key, secret_key, year, month, limits_filepath, output_folder):
-    """Run the complete pipeline: retrieve data, process, and save report."""
+def full_analysis(api_key, secret_key, year, month, limits_filepath, output_folder, streaming=False,
+                  metadata_ttl=DEFAULT_TTL, rollups=False, incremental=True):
+    """Run the complete pipeline: retrieve data, process, and save report.
+
+    With `streaming`, readings are processed one sensor at a time instead of
+    materializing the whole month, for sites whose month does not fit in RAM.
+    The sensor inventory comes from the metadata cache and is only
+    downloaded again once it is older than `metadata_ttl` seconds. With
+    `incremental`, a month cached before it ended is topped up with the
+    readings since, rather than trusted as-is. With `rollups`, the hourly/daily rollups are brought up to date on the way
+    and the month's rollup_analysis report is saved from them.
+    """
     print(f"\nStarting full analysis for {year}-{month:02d}")
 
     # Ensure output folder exists
     os.makedirs(output_folder, exist_ok=True)
 
-    sensor_ids = sensor_list(api_key, secret_key)
-    if not sensor_ids.any():
+    metadata = cached_sensor_metadata(api_key, secret_key, output_folder, ttl=metadata_ttl)
+    sensor_ids = metadata.index.to_numpy()
+    if len(sensor_ids) == 0:
         print("No sensors found. Exiting.")
         return
 
-    monthly_data = get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder)
+    if streaming:
+        chunks = iter_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder,
+                                   columns=REQUIRED_COLUMNS, incremental=incremental)
+        if rollups:
+            chunks = with_rollups(chunks, output_folder)
+        processed = process_sensor_data_streaming(chunks, limits_filepath, output_folder, year, month,
+                                                  metadata=metadata)
+        if rollups:
+            rollup_report(output_folder, year, month, limits_filepath)
+        print("\nAnalysis complete.")
+        print(processed)
+        return
+
+    monthly_data = get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder,
+                                    columns=REQUIRED_COLUMNS, incremental=incremental)
     if monthly_data.empty:
         print("No data to process.")
         return
+    if rollups:
+        update_rollups(monthly_data, output_folder)
 
-    processed = process_sensor_data(monthly_data, limits_filepath, output_folder, year, month)
+    processed = process_sensor_data(monthly_data, limits_filepath, output_folder, year, month,
+                                    metadata=metadata)
+    if rollups:
+        rollup_report(output_folder, year, month, limits_filepath)
     print("\nAnalysis complete.")
     print(processed)
 
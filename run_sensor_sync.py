@@ -0,0 +1,35 @@
+# run_sensor_sync.py
+import argparse
+import json
+from sensor_api import BASE_URL, get_client
+from sensor_data_retreiver import sync_sensors
+from sensor_metadata import cached_sensor_metadata
+
+def sync_site(site, max_workers=4):
+    """Append every sensor's readings since its watermark to the site's cache; returns {sensor_id: count}.
+
+    `site` is a dict like the batch runner's: 'name', 'api_key', 'secret_key',
+    'output_folder' and optionally 'base_url'.
+    """
+    client = get_client(site['api_key'], site['secret_key'], base_url=site.get('base_url', BASE_URL))
+    metadata = cached_sensor_metadata(site['api_key'], site['secret_key'], site['output_folder'],
+                                      client=client)
+    if metadata.empty:
+        print(f"No sensors found for {site['name']}. Skipping.")
+        return {}
+    print(f"\nSyncing {site['name']}")
+    return sync_sensors(metadata.index.to_numpy(), site['api_key'], site['secret_key'],
+                        site['output_folder'], max_workers=max_workers)
+
+# Example (e.g. from a daily cron job): python run_sensor_sync.py sites.json
+# where sites.json is the site list used by run_batch_analysis.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the sensor readings added since the last sync.")
+    parser.add_argument("sites", help="JSON file listing the sites and their API credentials")
+    parser.add_argument("--workers", type=int, default=4, help="sensors synced in parallel per site")
+    args = parser.parse_args()
+
+    with open(args.sites) as f:
+        sites = json.load(f)
+    for site in sites:
+        sync_site(site, max_workers=args.workers)
@@ -1,35 +1,349 @@
 # sensor_api.py
+import json
+import os
+import random
+import re
+import threading
+import time
 import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from sensor_data_processor import parse_custom_dates
 
-def sensor_list(api_key, secret_key):
-    """Fetch the list of sensors from the Monnit API."""
+BASE_URL = "https://www.imonnit.com/json"
+DEFAULT_RATE_LIMIT = 5.0  # requests per second per host
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures a smaller date window may avoid: payload too large and gateway timeout
+SHRINKABLE_STATUSES = {413, 504}
+# SensorDataMessages fields kept by the columnar decoders
+MESSAGE_FIELDS = ('MessageDate', 'PlotValue', 'SensorID', 'State', 'SignalStrength', 'Battery')
+
+class SensorDataError(Exception):
+    """A SensorDataMessages request that failed after retries.
+
+    `shrinkable` marks failures caused by the size of the request (timeouts,
+    oversize or truncated responses) that a smaller window may avoid.
+    """
+
+    def __init__(self, message, shrinkable=False):
+        super().__init__(message)
+        self.shrinkable = shrinkable
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self.interval = 1.0 / rate if rate else 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def retry_after_seconds(response):
+    """Seconds requested by a Retry-After header (delta or HTTP date), or None.
+
+    Dates without a usable zone ('-0000') are taken as UTC; a header that
+    cannot be parsed gives None, so the caller falls back to its backoff.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+def host_limiter(url, rate=None):
+    """Return the limiter shared by every client talking to the host of `url`.
+
+    A host starts at DEFAULT_RATE_LIMIT (5 requests/s) unless a rate is
+    given. Passing a different rate later changes it for every client of
+    that host; rate=None keeps the host's current rate.
+    """
+    host = urlparse(url).netloc
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = RateLimiter(DEFAULT_RATE_LIMIT if rate is None else rate)
+            _limiters[host] = limiter
+        elif rate is not None and limiter.rate != rate:
+            print(f"Rate limit for {host} changed from {limiter.rate} to {rate} requests/s")
+            limiter.set_rate(rate)
+        return limiter
+
+class SensorApiClient:
+    """Reusable Monnit API client backed by a pooled keep-alive session.
+
+    Requests are spaced by the limiter shared per host (see host_limiter);
+    `rate_limit` sets that host's rate, 5 requests/s by default.
+    """
+
+    def __init__(self, api_key, secret_key, base_url=BASE_URL, pool_size=10, timeout=(10, 120),
+                 rate_limit=None, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = host_limiter(self.base_url, rate_limit)
+        self.session = requests.Session()
+        self.session.headers.update({"APIKeyID": api_key, "APISecretKey": secret_key})
+
+        # One adapter per scheme; pool_maxsize bounds the keep-alive connections per host
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, method, data=None):
+        """POST to an API method (e.g. 'SensorListFull') over the shared session.
+
+        Connection errors, timeouts and 429/5xx responses are retried up to
+        `max_retries` times with jittered exponential backoff, waiting at
+        least as long as a Retry-After header asks. The last response (or
+        exception) is returned (or raised) once retries run out.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            try:
+                response = self.session.post(f"{self.base_url}/{method}", data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay, reason = self._backoff(attempt), type(e).__name__
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = max(self._backoff(attempt), retry_after_seconds(response) or 0.0)
+                reason = f"HTTP {response.status_code}"
+            print(f"{method}: {reason}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff delay for a retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key, secret_key, **kwargs):
+    """Return the shared client for a credential pair, creating it on first use.
+
+    A `rate_limit` passed for an existing client is applied to its host's limiter.
+    """
+    with _clients_lock:
+        client = _clients.get((api_key, secret_key))
+        if client is None:
+            client = SensorApiClient(api_key, secret_key, **kwargs)
+            _clients[(api_key, secret_key)] = client
+        elif 'rate_limit' in kwargs:
+            client.limiter = host_limiter(client.base_url, kwargs['rate_limit'])
+        return client
+
+def _reset_after_fork():
+    """Give forked worker processes their own clients instead of the parent's sockets."""
+    global _clients_lock, _limiters_lock
+    _clients.clear()
+    _limiters.clear()
+    _clients_lock = threading.Lock()
+    _limiters_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def sensor_inventory(api_key, secret_key, client=None):
+    """Fetch the full sensor inventory (SensorListFull) as a DataFrame, or None on error.
+
+    Connection failures, timeouts and error envelopes also give None, so
+    callers can fall back to cached metadata.
+    """
     print("Fetching sensor list...")
-    url = "https://www.imonnit.com/json/SensorListFull"
-    headers = {"APIKeyID": api_key, "APISecretKey": secret_key}
+    client = client or get_client(api_key, secret_key)
 
-    response = requests.post(url, headers=headers)
+    try:
+        response = client.post("SensorListFull")
+    except requests.RequestException as e:
+        print(f"Error fetching sensor list: {e}")
+        return None
     if response.status_code == 200:
-        data = response.json()
-        print(f"Retrieved {len(data['Result'])} sensors.")
-        df = pd.DataFrame(data['Result'])
-        return df['SensorID'].unique()
+        try:
+            result = response.json().get('Result')
+        except ValueError as e:
+            print(f"Error decoding sensor list: {e}")
+            return None
+        if not isinstance(result, list):
+            print(f"Error fetching sensor list: API error: {result}")
+            return None
+        print(f"Retrieved {len(result)} sensors.")
+        return pd.DataFrame(result)
     else:
         print(f"Error {response.status_code}: {response.text}")
+        return None
+
+def sensor_list(api_key, secret_key, client=None):
+    """Fetch the list of sensors from the Monnit API."""
+    df = sensor_inventory(api_key, secret_key, client=client)
+    if df is None or df.empty:
         return []
+    return df['SensorID'].unique()
+
+def sensor_data(sensor_id, from_date, to_date, api_key, secret_key, client=None):
+    """Fetch sensor data for a given sensor ID between two dates.
 
-def sensor_data(sensor_id, from_date, to_date, api_key, secret_key):
-    """Fetch sensor data for a given sensor ID between two dates."""
+    Returns the list of readings (possibly empty), or None if the request
+    still failed after retries so callers can tell a gap from a failure.
+    """
     print(f"Fetching data for sensor {sensor_id} from {from_date} to {to_date}...")
-    url = "https://www.imonnit.com/json/SensorDataMessages"
-    headers = {"APIKeyID": api_key, "APISecretKey": secret_key}
+    client = client or get_client(api_key, secret_key)
     params = {"sensorID": sensor_id, "fromDate": from_date, "toDate": to_date}
 
-    response = requests.post(url, headers=headers, data=params)
+    try:
+        response = client.post("SensorDataMessages", data=params)
+    except requests.RequestException as e:
+        print(f"Error fetching sensor {sensor_id}: {e}")
+        return None
     if response.status_code == 200:
-        data = response.json()
-        return data['Result']
+        result = response.json().get('Result')
+        if not isinstance(result, list):
+            print(f"Error fetching sensor {sensor_id}: API error: {result}")
+            return None
+        return result
     else:
         print(f"Error fetching sensor {sensor_id}: {response.status_code}")
-        return []
+        return None
+
+# Fast path: pull each field straight out of the raw body. Messages are flat
+# objects, so every field must match exactly once per message.
+MESSAGE_DATE_PATTERN = re.compile(rb'"MessageDate"\s*:\s*"\\?/Date\((-?\d+)')
+FIELD_PATTERNS = {field: re.compile(rb'"%s"\s*:\s*"?([^",}\]]*)' % field.encode())
+                  for field in ('PlotValue', 'State', 'SignalStrength', 'Battery')}
+FIELD_DTYPES = {'PlotValue': 'float64', 'State': 'int64', 'SignalStrength': 'int64', 'Battery': 'int64'}
+
+class MessageColumns:
+    """JSON object hook that files each message's fields straight into column lists.
+
+    Messages are recognised by their MessageDate key and reduced to None, so
+    the decoded Result list never holds per-reading dicts; other objects (the
+    response envelope) are returned as usual.
+    """
+
+    def __init__(self, fields=MESSAGE_FIELDS):
+        self.columns = {field: [] for field in fields}
+
+    def __call__(self, pairs):
+        values = dict(pairs)
+        if 'MessageDate' not in values:
+            return values
+        for field, column in self.columns.items():
+            column.append(values.get(field))
+        return None
+
+def to_numbers(raw_values, dtype):
+    """Convert raw byte strings to a numeric array, coercing nulls/bad values to NaN."""
+    values = np.array(raw_values, dtype=bytes)
+    try:
+        return values.astype(dtype)
+    except ValueError:
+        return pd.to_numeric(pd.Series(values.astype(str)), errors='coerce').to_numpy()
+
+def decode_messages(body):
+    """Decode a SensorDataMessages response body into a typed DataFrame.
+
+    Only the fields in MESSAGE_FIELDS are extracted, straight from the raw
+    bytes into column arrays, so no per-reading dicts are built. SensorID is
+    dropped since the caller knows it. `MessageDate` becomes a decoded
+    `timestamp` column and `PlotValue` a float. Bodies the fast path cannot
+    align column by column, and bodies without messages (which may be an
+    error envelope), go through the JSON decoder instead.
+    """
+    millis = MESSAGE_DATE_PATTERN.findall(body)
+    raw = {field: pattern.findall(body) for field, pattern in FIELD_PATTERNS.items()}
+    if not millis or any(len(values) != len(millis) for values in raw.values()):
+        return decode_messages_json(body)
+
+    frame = pd.DataFrame({field: to_numbers(values, FIELD_DTYPES[field]) for field, values in raw.items()})
+    frame['timestamp'] = np.array(millis, dtype=bytes).astype('int64').astype('datetime64[ms]')
+    return frame
+
+def decode_messages_json(body):
+    """Slower, format-tolerant decoder built on json with a columnar object hook.
+
+    Raises SensorDataError when the response is an error envelope (a
+    'Result' that is not a list of messages, e.g. "Invalid key").
+    """
+    hook = MessageColumns()
+    envelope = json.loads(body, object_pairs_hook=hook)
+    result = envelope.get('Result') if isinstance(envelope, dict) else None
+    if not isinstance(result, list):
+        raise SensorDataError(f"API error: {result if result is not None else envelope!r}")
+    columns = hook.columns
+    frame = pd.DataFrame({field: values for field, values in columns.items()
+                          if field not in ('MessageDate', 'SensorID')})
+    frame['PlotValue'] = pd.to_numeric(frame['PlotValue'], errors='coerce').astype('float64')
+    frame['timestamp'] = parse_custom_dates(pd.Series(columns['MessageDate'], dtype=object))
+    return frame
+
+def fetch_sensor_frame(sensor_id, from_date, to_date, api_key, secret_key, client=None):
+    """Fetch and decode readings into typed columns, raising SensorDataError on failure."""
+    print(f"Fetching data for sensor {sensor_id} from {from_date} to {to_date}...")
+    client = client or get_client(api_key, secret_key)
+    params = {"sensorID": sensor_id, "fromDate": from_date, "toDate": to_date}
+
+    try:
+        response = client.post("SensorDataMessages", data=params)
+    except (requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        raise SensorDataError(str(e), shrinkable=True) from e
+    except requests.RequestException as e:
+        raise SensorDataError(str(e)) from e
+    if response.status_code != 200:
+        raise SensorDataError(f"HTTP {response.status_code}",
+                              shrinkable=response.status_code in SHRINKABLE_STATUSES)
+    try:
+        return decode_messages(response.content)
+    except ValueError as e:  # truncated or malformed body
+        raise SensorDataError(f"undecodable response: {e}", shrinkable=True) from e
+
+def sensor_data_frame(sensor_id, from_date, to_date, api_key, secret_key, client=None):
+    """Like sensor_data, but decode the readings straight into typed columns.
+
+    Returns a DataFrame (possibly empty), or None if the request failed.
+    """
+    try:
+        return fetch_sensor_frame(sensor_id, from_date, to_date, api_key, secret_key, client=client)
+    except SensorDataError as e:
+        print(f"Error fetching sensor {sensor_id}: {e}")
+        return None
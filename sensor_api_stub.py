@@ -0,0 +1,270 @@
+# sensor_api_stub.py
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from sensor_api import SensorDataError, fetch_sensor_frame, get_client
+from sensor_cache import load_watermarks, read_sensor_month
+from sensor_data_retreiver import fetch_sensor_month
+
+# Sensors served by default: {SensorID: minutes between readings}
+DEFAULT_SENSORS = {101: 60, 102: 10, 103: 5}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive like the real API
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        status, body, headers = stub.respond(method, params, self.client_address)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubApi:
+    """
+    Local stand-in for the Monnit JSON API with fault injection.
+
+    Serves SensorListFull and SensorDataMessages for `sensors` ({SensorID:
+    minutes between readings}), with readings up to `now` if set. Faults
+    added with fail() are applied to matching requests before any data is
+    served. Every request is logged in `calls` as (method, params), and the
+    client ports seen in `connections`.
+    """
+
+    def __init__(self, sensors=None, now=None):
+        self.sensors = dict(sensors or DEFAULT_SENSORS)
+        self.now = now
+        self.faults = []
+        self.calls = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        """Serve on a free local port in a background thread; returns the base URL."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.stub = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/json"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.faults.clear()
+            self.calls.clear()
+            self.connections.clear()
+
+    def fail(self, status=503, times=1, sensor_id=None, from_date=None, retry_after=None, body=None,
+             delay=0.0):
+        """
+        Inject a fault for the next `times` matching requests.
+
+        A fault matches SensorDataMessages for `sensor_id` and/or `from_date`
+        ('MM/DD/YYYY'), or any request if both are None. It sleeps `delay`
+        seconds (past the client timeout simulates a hung server), then
+        answers `status` with `body` (default: a plain error) and an optional
+        Retry-After header.
+        """
+        with self._lock:
+            self.faults.append({'status': status, 'times': times, 'sensor_id': sensor_id,
+                                'from_date': from_date, 'retry_after': retry_after, 'body': body,
+                                'delay': delay})
+
+    def data_calls(self, sensor_id=None):
+        """The SensorDataMessages requests made so far, optionally for one sensor."""
+        return [params for method, params in self.calls if method == "SensorDataMessages"
+                and (sensor_id is None or int(params['sensorID']) == sensor_id)]
+
+    def take_fault(self, params):
+        with self._lock:
+            for fault in self.faults:
+                if fault['times'] <= 0:
+                    continue
+                if fault['sensor_id'] is not None and str(fault['sensor_id']) != params.get('sensorID'):
+                    continue
+                if fault['from_date'] is not None and fault['from_date'] != params.get('fromDate'):
+                    continue
+                fault['times'] -= 1
+                return fault
+        return None
+
+    def respond(self, method, params, client_address):
+        with self._lock:
+            self.calls.append((method, params))
+            self.connections.add(client_address[1])
+        fault = self.take_fault(params)
+        if fault:
+            time.sleep(fault['delay'])
+            headers = {"Retry-After": str(fault['retry_after'])} if fault['retry_after'] is not None else {}
+            body = fault['body'] if fault['body'] is not None else {"Result": "Stub error"}
+            return fault['status'], json.dumps(body).encode(), headers
+
+        if method == "SensorListFull":
+            result = [{"SensorID": sensor_id, "SensorName": f"Sensor {sensor_id}", "MonnitApplicationID": 2,
+                       "ReportInterval": minutes, "LastCommunicationDate": r"\/Date(1735689600000)\/"}
+                      for sensor_id, minutes in self.sensors.items()]
+        elif method == "SensorDataMessages":
+            result = self.readings(int(params['sensorID']),
+                                   datetime.strptime(params['fromDate'], "%m/%d/%Y"),
+                                   datetime.strptime(params['toDate'], "%m/%d/%Y"))
+        else:
+            return 404, json.dumps({"Result": f"Unknown method {method}"}).encode(), {}
+        # The API escapes the slashes of its /Date(...)/ values
+        body = json.dumps({"Method": method, "Result": result}).replace(r"\\/", r"\/")
+        return 200, body.encode(), {}
+
+    def readings(self, sensor_id, from_date, to_date):
+        """Deterministic readings for whole days from `from_date` to `to_date` (capped at `now`)."""
+        minutes = self.sensors.get(sensor_id)
+        if minutes is None:
+            return []
+        end = to_date + timedelta(days=1)
+        if self.now is not None:
+            end = min(end, self.now)
+        messages, at = [], from_date
+        while at < end:
+            millis = int(at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            value = 20 + 8 * ((at.hour + sensor_id) % 12) / 11 - 4
+            messages.append({"DataMessageGUID": f"{sensor_id}-{millis}", "SensorID": sensor_id,
+                             "MessageDate": rf"\/Date({millis})\/", "State": 0, "SignalStrength": 80,
+                             "Battery": 100, "Data": f"{value:.2f}", "DisplayData": f"{value:.2f} C",
+                             "PlotValue": f"{value:.2f}", "MetNotificationRequirements": False,
+                             "GatewayID": 1})
+            at += timedelta(minutes=minutes)
+        return messages
+
+def client_for(stub_url, name, **kwargs):
+    """A client of its own for one check (clients are shared per credential pair)."""
+    options = dict(base_url=stub_url, rate_limit=1000, backoff_base=0.01, max_retries=3)
+    options.update(kwargs)
+    get_client(f"stub-{name}", "secret", **options)
+    return f"stub-{name}", "secret"
+
+def check_keep_alive(stub, url):
+    """Sequential requests reuse one pooled connection."""
+    api_key, secret_key = client_for(url, "keep-alive")
+    for day in range(1, 21):
+        fetch_sensor_frame(101, f"01/{day:02d}/2025", f"01/{day:02d}/2025", api_key, secret_key)
+    return len(stub.connections) == 1, f"{len(stub.calls)} requests over {len(stub.connections)} connection(s)"
+
+def check_retry(stub, url):
+    """A 503 with Retry-After, then a 429, are retried until the window succeeds."""
+    api_key, secret_key = client_for(url, "retry")
+    stub.fail(503, retry_after=0)
+    stub.fail(429, retry_after="Wed, 01 Jan 2025 00:00:00 GMT")
+    frame = fetch_sensor_frame(101, "01/01/2025", "01/01/2025", api_key, secret_key)
+    return len(stub.calls) == 3 and len(frame) == 24, f"{len(stub.calls)} requests, {len(frame)} readings"
+
+def check_retries_exhausted(stub, url):
+    """A window still failing after max_retries raises a non-shrinkable SensorDataError."""
+    api_key, secret_key = client_for(url, "exhausted")
+    stub.fail(503, times=10)
+    try:
+        fetch_sensor_frame(101, "01/01/2025", "01/01/2025", api_key, secret_key)
+    except SensorDataError as e:
+        return len(stub.calls) == 4 and not e.shrinkable, f"{len(stub.calls)} requests, raised {e}"
+    return False, "no error raised"
+
+def check_error_envelope(stub, url):
+    """A 200 whose Result is an error message fails the window instead of decoding as empty."""
+    api_key, secret_key = client_for(url, "envelope")
+    stub.fail(200, body={"Method": "SensorDataMessages", "Result": "Invalid APIKeyID"})
+    try:
+        fetch_sensor_frame(101, "01/01/2025", "01/01/2025", api_key, secret_key)
+    except SensorDataError as e:
+        return len(stub.calls) == 1 and not e.shrinkable, f"raised {e}"
+    return False, "decoded without error"
+
+def check_failed_window_resumes(stub, url):
+    """
+    A window that keeps failing leaves the month incomplete with the
+    watermark before it; a rerun resumes at that window, never refetching
+    journaled days, and completes the month.
+    """
+    api_key, secret_key = client_for(url, "resume", max_retries=1)
+    # Sensor 101 reports hourly: an 8-day first window, then the rest of the month in one
+    stub.fail(503, times=2, sensor_id=101, from_date="01/09/2025")
+    with tempfile.TemporaryDirectory() as folder:
+        partial = fetch_sensor_month(101, 2025, 1, api_key, secret_key, folder)
+        watermark = load_watermarks(folder).get(101)
+        first_run = len(stub.data_calls())
+        complete = fetch_sensor_month(101, 2025, 1, api_key, secret_key, folder)
+        resumed = stub.data_calls()[first_run:]
+        cached = read_sensor_month(folder, 101, 2025, 1)
+        ok = (partial.attrs.get('incomplete') and str(watermark) == "2025-01-08 23:00:00"
+              and resumed and resumed[0]['fromDate'] == "01/09/2025"
+              and all(call['fromDate'] >= "01/09/2025" for call in resumed)
+              and not complete.attrs.get('incomplete') and len(cached) == 31 * 24
+              and not cached['timestamp'].duplicated().any()
+              and str(load_watermarks(folder).get(101)) == "2025-01-31 23:00:00"
+              and os.path.exists(os.path.join(folder, "sensor_cache", "year=2025", "month=01",
+                                              "sensor_id=101", "_complete")))
+        detail = (f"first run {len(partial)} readings, watermark {watermark}; rerun requested "
+                  f"{[call['fromDate'] for call in resumed]}, {len(cached)} readings cached")
+    return ok, detail
+
+def check_timeout_shrinks_window(stub, url):
+    """Gateway timeouts on a window halve it and retry instead of failing the month."""
+    api_key, secret_key = client_for(url, "shrink", max_retries=1)
+    stub.fail(504, times=2, sensor_id=101, from_date="01/01/2025")
+    with tempfile.TemporaryDirectory() as folder:
+        sensor_df = fetch_sensor_month(101, 2025, 1, api_key, secret_key, folder)
+        calls = [(call['fromDate'], call['toDate']) for call in stub.data_calls()]
+        ok = (not sensor_df.attrs.get('incomplete') and len(sensor_df) == 31 * 24
+              and calls[2] == ("01/01/2025", "01/04/2025"))
+    return ok, f"windows requested {calls}"
+
+CHECKS = [check_keep_alive, check_retry, check_retries_exhausted, check_error_envelope,
+          check_failed_window_resumes, check_timeout_shrinks_window]
+
+def run_checks(checks=CHECKS):
+    """Run each check against a fresh stub state; returns True if all passed."""
+    stub = StubApi()
+    url = stub.start()
+    passed = 0
+    try:
+        for check in checks:
+            stub.reset()
+            ok, detail = check(stub, url)
+            passed += ok
+            print(f"{'PASS' if ok else 'FAIL'} {check.__name__}: {detail}")
+    finally:
+        stub.stop()
+    print(f"{passed} of {len(checks)} checks passed.")
+    return passed == len(checks)
+
+# Example: python sensor_api_stub.py   (or --serve to point the scripts at the stub)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the retry/resume checks against a local Monnit API "
+                                                 "stub with fault injection.")
+    parser.add_argument("--serve", action="store_true", help="serve the stub until interrupted")
+    args = parser.parse_args()
+
+    if args.serve:
+        stub = StubApi()
+        print(f"Stub API at {stub.start()} (base_url for get_client); Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stub.stop()
+    else:
+        raise SystemExit(0 if run_checks() else 1)
@@ -0,0 +1,197 @@
+# sensor_cache.py
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+from atomic_files import write_json
+from sensor_data_processor import parse_custom_dates
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_DIR = "sensor_cache"
+# Underscore-prefixed files are skipped by Parquet dataset discovery
+WATERMARK_FILE = "_watermarks.json"
+WATERMARK_LOCK = "_watermarks.lock"
+COMPLETE_MARKER = "_complete"
+JOURNAL_FILE = "_journal.json"
+
+_watermark_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` (created if missing), across threads and processes."""
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s; keep waiting
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def partition_dir(output_folder, sensor_id, year, month):
+    """Hive-style partition folder holding one sensor-month of readings."""
+    return os.path.join(output_folder, CACHE_DIR, f"year={year}", f"month={month:02d}",
+                        f"sensor_id={sensor_id}")
+
+def legacy_csv_path(output_folder, sensor_id, year, month):
+    """Path of the per-sensor CSV cache written by earlier versions."""
+    return os.path.join(output_folder, f"sensor_{sensor_id}_{year}_{month:02d}.csv")
+
+def normalize_readings(sensor_df, sensor_id):
+    """Give raw API/CSV readings stable column types for the columnar cache."""
+    sensor_df = sensor_df.copy()
+    sensor_df['SensorID'] = sensor_id
+    sensor_df['PlotValue'] = pd.to_numeric(sensor_df['PlotValue'], errors='coerce').astype('float64')
+    if 'MessageDate' in sensor_df.columns:
+        sensor_df['timestamp'] = parse_custom_dates(sensor_df['MessageDate'])
+        sensor_df = sensor_df.drop(columns=['MessageDate'])
+    # Free-form API fields may mix numbers and text; store them as strings
+    for col in sensor_df.columns:
+        if sensor_df[col].dtype == object:
+            sensor_df[col] = sensor_df[col].astype('string')
+    return sensor_df
+
+def write_sensor_month(sensor_df, output_folder, sensor_id, year, month):
+    """Store a normalized sensor-month as a Parquet partition."""
+    folder = partition_dir(output_folder, sensor_id, year, month)
+    os.makedirs(folder, exist_ok=True)
+    sensor_df.to_parquet(os.path.join(folder, "data.parquet"), index=False)
+
+def uncached_readings(sensor_df, folder, exclude=None):
+    """Drop readings whose timestamp is already stored in the partition's other Parquet files.
+
+    Windows and appended parts can overlap after a failed window is
+    refetched, so each write keeps only readings the partition lacks.
+    """
+    files = [name for name in os.listdir(folder) if name.endswith(".parquet") and name != exclude]
+    if not files:
+        return sensor_df
+    cached = pd.concat([pd.read_parquet(os.path.join(folder, name), columns=['timestamp'])
+                        for name in files], ignore_index=True)
+    return sensor_df[~sensor_df['timestamp'].isin(cached['timestamp'])]
+
+def write_window(sensor_df, output_folder, sensor_id, year, month, window_key):
+    """Store the readings of one fetch window; rewriting a window replaces it."""
+    folder = partition_dir(output_folder, sensor_id, year, month)
+    os.makedirs(folder, exist_ok=True)
+    name = f"window-{window_key}.parquet"
+    sensor_df = uncached_readings(sensor_df, folder, exclude=name)
+    if not sensor_df.empty:
+        sensor_df.to_parquet(os.path.join(folder, name), index=False)
+
+def load_journal(output_folder, sensor_id, year, month):
+    """Return the set of completed window keys for a sensor-month, or None if never journaled."""
+    path = os.path.join(partition_dir(output_folder, sensor_id, year, month), JOURNAL_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return set(json.load(f)['completed'])
+
+def record_window(output_folder, sensor_id, year, month, window_key):
+    """Mark a fetch window as completed in the sensor-month's journal."""
+    folder = partition_dir(output_folder, sensor_id, year, month)
+    os.makedirs(folder, exist_ok=True)
+    completed = load_journal(output_folder, sensor_id, year, month) or set()
+    completed.add(window_key)
+    write_json(os.path.join(folder, JOURNAL_FILE), {'completed': sorted(completed)})
+
+def append_readings(sensor_df, output_folder, sensor_id):
+    """Append normalized readings as new part files in their year/month partitions.
+
+    Readings already cached (e.g. behind a watermark held back by a failed
+    window) are skipped. Returns the number of readings written.
+    """
+    months = sensor_df['timestamp'].dt.to_period('M')
+    written = 0
+    for period, part in sensor_df.groupby(months):
+        folder = partition_dir(output_folder, sensor_id, period.year, period.month)
+        os.makedirs(folder, exist_ok=True)
+        part = uncached_readings(part, folder)
+        if part.empty:
+            continue
+        written += len(part)
+        part.to_parquet(os.path.join(folder, f"part-{time.time_ns()}.parquet"), index=False)
+    return written
+
+def has_sensor_month(output_folder, sensor_id, year, month):
+    return os.path.isdir(partition_dir(output_folder, sensor_id, year, month))
+
+def mark_complete(output_folder, sensor_id, year, month):
+    """Record that a sensor-month was fetched through the end of the month."""
+    folder = partition_dir(output_folder, sensor_id, year, month)
+    os.makedirs(folder, exist_ok=True)
+    open(os.path.join(folder, COMPLETE_MARKER), "w").close()
+
+def is_complete(output_folder, sensor_id, year, month):
+    return os.path.exists(os.path.join(partition_dir(output_folder, sensor_id, year, month),
+                                       COMPLETE_MARKER))
+
+def load_watermarks(output_folder):
+    """Return {sensor_id: last MessageDate} for every synced sensor."""
+    path = os.path.join(output_folder, CACHE_DIR, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(k): pd.Timestamp(v) for k, v in json.load(f).items()}
+
+def update_watermark(output_folder, sensor_id, last_message):
+    """Advance a sensor's watermark; it never moves backwards.
+
+    The read-modify-write holds a lock file, so batch worker processes
+    sharing an output folder do not lose each other's updates.
+    """
+    if last_message is None or pd.isna(last_message):
+        return
+    folder = os.path.join(output_folder, CACHE_DIR)
+    os.makedirs(folder, exist_ok=True)
+    with _watermark_lock, file_lock(os.path.join(folder, WATERMARK_LOCK)):
+        marks = load_watermarks(output_folder)
+        current = marks.get(int(sensor_id))
+        if current is not None and current >= last_message:
+            return
+        marks[int(sensor_id)] = pd.Timestamp(last_message)
+        write_json(os.path.join(folder, WATERMARK_FILE),
+                   {str(k): v.isoformat() for k, v in marks.items()}, indent=1)
+
+def cached_last_message(output_folder, sensor_id):
+    """Latest cached reading for a sensor, or None if nothing is cached."""
+    root = os.path.join(output_folder, CACHE_DIR)
+    if not os.path.isdir(root):
+        return None
+    data = pd.read_parquet(root, columns=['timestamp'], filters=[('sensor_id', '=', int(sensor_id))])
+    return data['timestamp'].max() if not data.empty else None
+
+def read_sensor_month(output_folder, sensor_id, year, month, columns=None):
+    """Load one cached sensor-month, migrating a legacy CSV cache on first use.
+
+    Returns None if there is no cached data (no Parquet files and no CSV).
+    """
+    folder = partition_dir(output_folder, sensor_id, year, month)
+    if os.path.isdir(folder):
+        if not any(name.endswith(".parquet") for name in os.listdir(folder)):
+            return None
+    else:
+        csv_file = legacy_csv_path(output_folder, sensor_id, year, month)
+        if not os.path.exists(csv_file):
+            return None
+        print(f"Migrating {csv_file} to the Parquet cache.")
+        write_sensor_month(normalize_readings(pd.read_csv(csv_file), sensor_id),
+                           output_folder, sensor_id, year, month)
+    return pd.read_parquet(folder, columns=columns)
@@ -1,44 +1,140 @@
 # sensor_data_processor.py
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import os
-from datetime import datetime
-
-def parse_custom_date(date_str):
-    """Convert Monnit `/Date(...)` to Python datetime."""
-    if date_str.startswith('/Date('):
-        timestamp = int(date_str[6:-2]) / 1000
-        return datetime.utcfromtimestamp(timestamp)
-    return pd.NaT
-
-def process_sensor_data(monthly_data, limits_filepath, output_folder, year, month):
-    """Process sensor data against limits and save the analysis."""
-    print("Loading limits...")
+
+LIMIT_COLUMNS = ['lim_min', 'lim_max', 'lim_avg', 'uom', 'SensorName']
+
+# Raw reading columns process_sensor_data reads (for column pushdown from the cache)
+REQUIRED_COLUMNS = ['SensorID', 'timestamp', 'PlotValue']
+
+# Longest interval a single reading is assumed to cover (sensor heartbeats run 1-60 minutes)
+DEFAULT_MAX_GAP = pd.Timedelta(minutes=60)
+# With a known heartbeat, a reading covers up to this many heartbeats (one missed message)
+HEARTBEAT_GAP_FACTOR = 2
+
+# `/Date(ms)/` with an optional `+hhmm`/`-hhmm` offset suffix
+MONNIT_DATE_PATTERN = r'^/Date\((?P<ms>-?\d+)(?:[+-]\d{4})?\)/$'
+
+def parse_custom_dates(date_series):
+    """Convert a column of Monnit `/Date(...)/` strings to datetime64 in one pass.
+
+    The millisecond count is UTC already; an offset suffix only names the
+    sender's local zone and is ignored. Unrecognized values become NaT.
+    """
+    dates = pa.array(date_series.astype(object), type=pa.string(), from_pandas=True)
+    millis = pc.struct_field(pc.extract_regex(dates, MONNIT_DATE_PATTERN), [0])
+    timestamps = pc.cast(pc.cast(millis, pa.int64()), pa.timestamp('ms'))
+    return pd.Series(timestamps.to_numpy(zero_copy_only=False), index=date_series.index)
+
+def load_limits(limits_filepath):
+    """Load the limits CSV indexed by SensorID, with text columns as categoricals."""
     limits = pd.read_csv(limits_filepath, delimiter=';')
-    limits_dict = limits.rename(columns={"Min": "lim_min", "Max": "lim_max", "Avg": "lim_avg",
-                                         "UOM": "uom", "SensorName": "SensorName"})
-    limits_dict = limits_dict.set_index("SensorID")
+    limits = limits.rename(columns={"Min": "lim_min", "Max": "lim_max", "Avg": "lim_avg",
+                                    "UOM": "uom", "SensorName": "SensorName"})
+    limits = limits.drop_duplicates(subset="SensorID").set_index("SensorID")
+    for col in ['uom', 'SensorName']:
+        limits[col] = limits[col].astype('category')
+    return limits
 
-    # Ensure numeric
-    monthly_data['PlotValue'] = pd.to_numeric(monthly_data['PlotValue'], errors='coerce')
-    monthly_data = monthly_data.dropna(subset=['PlotValue'])
+def attach_limits(monthly_data, limits):
+    """Attach limit columns to every reading with a single index lookup.
 
-    # Convert dates
-    monthly_data['timestamp'] = monthly_data['MessageDate'].apply(parse_custom_date)
+    Text columns stay categorical so they cost one small integer per reading.
+    Sensors missing from the limits file are reported and get empty limits.
+    """
+    positions = limits.index.get_indexer(monthly_data['SensorID'])
+    unmatched = positions == -1
+    if unmatched.any():
+        missing = pd.unique(monthly_data['SensorID'].to_numpy()[unmatched])
+        print(f"Warning: no limits found for {len(missing)} sensor(s): {sorted(missing.tolist())}")
 
-    # Map limits
-    for col in ['lim_min', 'lim_max', 'lim_avg', 'uom', 'SensorName']:
-        monthly_data[col] = monthly_data['SensorID'].map(
-            lambda x: limits_dict.at[x, col] if x in limits_dict.index else None
-        )
+    for col in LIMIT_COLUMNS:
+        values = limits[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()[positions]
+            codes[unmatched] = -1
+            column = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            # Keep the limits' own dtype unless unmatched sensors need NaN
+            column = values.to_numpy()[positions]
+            if unmatched.any():
+                column = column.astype('float64')
+                column[unmatched] = float('nan')
+        monthly_data[col] = column
+    return monthly_data
 
-    # Non-compliant check
-    monthly_data['non_compliant'] = (
-        (monthly_data['PlotValue'] < monthly_data['lim_min']) |
-        (monthly_data['PlotValue'] > monthly_data['lim_max'])
+def excursion_durations(readings, max_gap=DEFAULT_MAX_GAP):
+    """Time-weighted out-of-spec hours and longest continuous excursion per sensor.
+
+    Each reading is taken to hold until the sensor's next reading, capped at
+    `max_gap`; a sensor's last reading and readings without a timestamp add no
+    time. A gap longer than `max_gap` also ends an excursion. `max_gap` may
+    be a Series of per-sensor caps indexed by SensorID (see heartbeat_gaps).
+    """
+    timed = readings['timestamp'].notna().to_numpy()
+    sensor_ids = readings['SensorID'].to_numpy()[timed]
+    times = readings['timestamp'].to_numpy(dtype='datetime64[ns]')[timed].astype('int64')
+    non_compliant = readings['non_compliant'].to_numpy(dtype=bool)[timed]
+
+    order = np.lexsort((times, sensor_ids))
+    sensor_ids, times, non_compliant = sensor_ids[order], times[order], non_compliant[order]
+
+    if isinstance(max_gap, pd.Series):
+        cap = pd.to_timedelta(max_gap.reindex(sensor_ids)).fillna(DEFAULT_MAX_GAP)
+        cap = cap.to_numpy(dtype='timedelta64[ns]').astype('int64')[:-1]
+    else:
+        cap = pd.Timedelta(max_gap).value
+    same_sensor = sensor_ids[1:] == sensor_ids[:-1]
+    gaps = np.where(same_sensor, np.diff(times), 0)
+    hours = np.zeros(len(times))
+    hours[:-1] = np.minimum(gaps, cap) / pd.Timedelta(hours=1).value
+    oos_hours = np.where(non_compliant, hours, 0.0)
+
+    # A new run starts at each change of sensor or status, and after an over-long gap
+    starts = np.ones(len(times), dtype=bool)
+    starts[1:] = ~same_sensor | (non_compliant[1:] != non_compliant[:-1]) | (gaps > cap)
+    run_hours = np.bincount(np.cumsum(starts) - 1, weights=oos_hours, minlength=starts.sum())
+
+    return pd.DataFrame({
+        'non_compliant_hours': pd.Series(oos_hours).groupby(sensor_ids).sum(),
+        'longest_excursion_hours': pd.Series(run_hours).groupby(sensor_ids[starts]).max(),
+    }).rename_axis('SensorID')
+
+def heartbeat_gaps(metadata, default=DEFAULT_MAX_GAP):
+    """Per-sensor max_gap from cached heartbeats (ReportInterval, minutes).
+
+    Sensors without a known heartbeat fall back to `default`.
+    """
+    minutes = pd.to_numeric(metadata['ReportInterval'], errors='coerce')
+    gaps = pd.to_timedelta(minutes * HEARTBEAT_GAP_FACTOR, unit='min')
+    return gaps.where(minutes > 0, pd.Timedelta(default))
+
+def fill_sensor_names(agg, metadata):
+    """Use the cached sensor names where the limits file has none."""
+    names = metadata['SensorName'].reindex(agg['SensorID']).to_numpy()
+    agg['SensorName'] = agg['SensorName'].astype(object).where(agg['SensorName'].notna(), names)
+    return agg
+
+def aggregate_compliance(monthly_data, max_gap=DEFAULT_MAX_GAP):
+    """Summarize readings per sensor in one grouped pass.
+
+    Out-of-spec statistics come from pre-masked columns (the value, and the
+    reading's day as an integer code, kept only where non-compliant) so every
+    aggregate is a built-in groupby reduction rather than a Python callback.
+    Out-of-spec time comes from excursion_durations.
+    """
+    non_compliant = monthly_data['non_compliant'].to_numpy(dtype=bool)
+    day_codes = monthly_data['timestamp'].to_numpy(dtype='datetime64[D]').astype('int64')
+    has_day = non_compliant & monthly_data['timestamp'].notna().to_numpy()
+    readings = monthly_data.assign(
+        oos_value=monthly_data['PlotValue'].where(non_compliant),
+        oos_day=pd.Series(day_codes, index=monthly_data.index).where(has_day),
     )
 
-    # Aggregate
-    agg = monthly_data.groupby('SensorID').agg(
+    agg = readings.groupby('SensorID').agg(
         SensorName=('SensorName', 'first'),
         UOM=('uom', 'first'),
         min=('PlotValue', 'min'),
@@ -47,16 +143,164 @@ def process_sensor_data(monthly_data, limits_filepath, output_folder, year, mont
         lim_min=('lim_min', 'first'),
         lim_max=('lim_max', 'first'),
         lim_avg=('lim_avg', 'first'),
-        avg_out_of_spec=('PlotValue', lambda x: x[monthly_data.loc[x.index, 'non_compliant']].mean()),
-        non_compliant_hours=('non_compliant', 'sum'),
-        non_compliant_days=('timestamp', lambda x: x[monthly_data.loc[x.index, 'non_compliant']].dt.date.nunique())
-    ).reset_index()
+        avg_out_of_spec=('oos_value', 'mean'),
+        non_compliant_readings=('non_compliant', 'sum'),
+        non_compliant_days=('oos_day', 'nunique')
+    )
+    return join_durations(agg, excursion_durations(monthly_data, max_gap)).reset_index()
+
+def join_durations(agg, durations):
+    """Add duration columns next to the reading counts (0 for sensors without timed readings)."""
+    agg = agg.join(durations).fillna({'non_compliant_hours': 0.0, 'longest_excursion_hours': 0.0})
+    columns = list(agg.columns.drop(['non_compliant_hours', 'longest_excursion_hours']))
+    at = columns.index('non_compliant_readings')
+    return agg[columns[:at] + ['non_compliant_hours', 'longest_excursion_hours'] + columns[at:]]
+
+def prepare_readings(monthly_data, limits):
+    """Type the readings, attach their limits and flag non-compliant ones."""
+    # Ensure numeric
+    monthly_data['PlotValue'] = pd.to_numeric(monthly_data['PlotValue'], errors='coerce')
+    monthly_data = monthly_data.dropna(subset=['PlotValue'])
+
+    # Convert dates (cached readings arrive with `timestamp` already decoded)
+    if 'timestamp' not in monthly_data.columns:
+        monthly_data['timestamp'] = parse_custom_dates(monthly_data['MessageDate'])
 
-    agg['Compliant Yes/No'] = agg['non_compliant_hours'].apply(lambda x: 'No' if x > 0 else 'Yes')
+    # Map limits
+    monthly_data = attach_limits(monthly_data, limits)
+
+    # Non-compliant check
+    monthly_data['non_compliant'] = (
+        (monthly_data['PlotValue'] < monthly_data['lim_min']) |
+        (monthly_data['PlotValue'] > monthly_data['lim_max'])
+    )
+    return monthly_data
+
+def save_analysis(agg, output_folder, year, month, incomplete=()):
+    """Flag compliance per sensor and write processed_analysis_<year>_<month>.csv.
+
+    Sensors in `incomplete` had windows that could not be fetched; they are
+    marked 'No' in the Data Complete Yes/No column, as their figures only
+    cover part of the month.
+    """
+    incomplete = sorted({int(sensor_id) for sensor_id in incomplete})
+    agg['Data Complete Yes/No'] = np.where(agg['SensorID'].isin(incomplete), 'No', 'Yes')
+    agg['Compliant Yes/No'] = np.where(agg['non_compliant_readings'] > 0, 'No', 'Yes')
+    if incomplete:
+        print(f"Warning: sensors {incomplete} are missing data for {year}-{month:02d}; "
+              f"rerun to fetch the missing windows.")
 
-    # Save
     processed_file = os.path.join(output_folder, f"processed_analysis_{year}_{month:02d}.csv")
     agg.to_csv(processed_file, index=False)
     print(f"Saved processed analysis to {processed_file}")
-
     return agg
+
+def process_sensor_data(monthly_data, limits_filepath, output_folder, year, month,
+                        max_gap=DEFAULT_MAX_GAP, limits=None, metadata=None):
+    """Process sensor data against limits and save the analysis.
+
+    `non_compliant_hours` is out-of-spec time in hours, with each reading
+    covering the interval to the next one (at most `max_gap`). Pass
+    `limits` from load_limits to skip re-reading the limits CSV, and
+    `metadata` from sensor_metadata to cap gaps by each sensor's heartbeat
+    and name sensors missing from the limits file. Sensors listed in
+    `monthly_data.attrs['incomplete_sensors']` (see get_monthly_data) are
+    marked as having incomplete data.
+    """
+    incomplete = monthly_data.attrs.get('incomplete_sensors', [])
+    if limits is None:
+        print("Loading limits...")
+        limits = load_limits(limits_filepath)
+    if metadata is not None:
+        max_gap = heartbeat_gaps(metadata, max_gap)
+
+    monthly_data = prepare_readings(monthly_data, limits)
+    agg = aggregate_compliance(monthly_data, max_gap)
+    if metadata is not None:
+        agg = fill_sensor_names(agg, metadata)
+    return save_analysis(agg, output_folder, year, month, incomplete)
+
+# Partial aggregates and how they combine across chunks
+PARTIAL_MERGE = {'count': 'sum', 'total': 'sum', 'min': 'min', 'max': 'max',
+                 'oos_total': 'sum', 'oos_count': 'sum', 'non_compliant_readings': 'sum',
+                 'non_compliant_hours': 'sum', 'longest_excursion_hours': 'max'}
+
+def partial_aggregates(readings, max_gap=DEFAULT_MAX_GAP):
+    """Mergeable per-sensor partials for one chunk of prepared readings.
+
+    Returns the per-sensor sums/extremes and the distinct (SensorID, day)
+    pairs holding out-of-spec readings. Durations are exact when a chunk
+    holds all of a sensor's readings; a sensor split across chunks loses the
+    interval between them and its excursions are split at the boundary.
+    """
+    non_compliant = readings['non_compliant'].to_numpy(dtype=bool)
+    partial = readings.assign(oos_value=readings['PlotValue'].where(non_compliant)).groupby('SensorID').agg(
+        count=('PlotValue', 'count'),
+        total=('PlotValue', 'sum'),
+        min=('PlotValue', 'min'),
+        max=('PlotValue', 'max'),
+        oos_total=('oos_value', 'sum'),
+        oos_count=('oos_value', 'count'),
+        non_compliant_readings=('non_compliant', 'sum')
+    )
+    partial = join_durations(partial, excursion_durations(readings, max_gap))
+
+    has_day = non_compliant & readings['timestamp'].notna().to_numpy()
+    days = pd.DataFrame({
+        'SensorID': readings['SensorID'].to_numpy()[has_day],
+        'day': readings['timestamp'].to_numpy(dtype='datetime64[D]')[has_day],
+    }).drop_duplicates()
+    return partial, days
+
+def process_sensor_data_streaming(chunks, limits_filepath, output_folder, year, month,
+                                  max_gap=DEFAULT_MAX_GAP, limits=None, metadata=None):
+    """Process readings chunk by chunk (e.g. one sensor at a time) and save the analysis.
+
+    Only per-sensor partials are kept between chunks, so peak memory is
+    bounded by the largest chunk rather than the month. The saved CSV has
+    the same layout as process_sensor_data; sensors whose chunk has
+    `attrs['incomplete']` set are marked as having incomplete data.
+    """
+    if limits is None:
+        print("Loading limits...")
+        limits = load_limits(limits_filepath)
+    if metadata is not None:
+        max_gap = heartbeat_gaps(metadata, max_gap)
+
+    # Per-chunk partials are merged once at the end rather than after every chunk
+    partials, day_pairs, incomplete = [], [], set()
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        if chunk.attrs.get('incomplete'):
+            incomplete.update(chunk['SensorID'].unique().tolist())
+        partial, days = partial_aggregates(prepare_readings(chunk, limits), max_gap)
+        partials.append(partial)
+        day_pairs.append(days)
+
+    if not partials:
+        print("No data to process.")
+        return None
+
+    partials = pd.concat(partials).groupby(level=0).agg(PARTIAL_MERGE).sort_index()
+    day_pairs = pd.concat(day_pairs).drop_duplicates()
+    sensor_limits = limits.reindex(partials.index)
+    agg = pd.DataFrame({
+        'SensorName': sensor_limits['SensorName'],
+        'UOM': sensor_limits['uom'],
+        'min': partials['min'],
+        'max': partials['max'],
+        'mean': partials['total'] / partials['count'],
+        'lim_min': sensor_limits['lim_min'],
+        'lim_max': sensor_limits['lim_max'],
+        'lim_avg': sensor_limits['lim_avg'],
+        'avg_out_of_spec': (partials['oos_total'] / partials['oos_count']).where(partials['oos_count'] > 0),
+        'non_compliant_hours': partials['non_compliant_hours'],
+        'longest_excursion_hours': partials['longest_excursion_hours'],
+        'non_compliant_readings': partials['non_compliant_readings'],
+        'non_compliant_days': day_pairs.groupby('SensorID').size()
+                                       .reindex(partials.index, fill_value=0),
+    }, index=partials.index).rename_axis('SensorID').reset_index()
+    if metadata is not None:
+        agg = fill_sensor_names(agg, metadata)
+    return save_analysis(agg, output_folder, year, month, incomplete)
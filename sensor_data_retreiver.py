@@ -1,49 +1,390 @@
 # sensor_data_retriever.py
-import os
+import threading
 import pandas as pd
-from datetime import datetime, timedelta
-from sensor_api import sensor_data
-
-def get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder):
-    """Download and save monthly data per sensor into CSVs."""
-    all_data = pd.DataFrame()
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sensor_api import SensorDataError, fetch_sensor_frame
+from sensor_cache import (append_readings, cached_last_message, is_complete, load_journal,
+                          load_watermarks, mark_complete, normalize_readings, read_sensor_month,
+                          record_window, update_watermark, write_window)
 
+def month_bounds(year, month):
+    """Return the first and last day of a calendar month."""
     start_date = datetime(year, month, 1)
     next_month = start_date.replace(day=28) + timedelta(days=4)
     end_date = next_month - timedelta(days=next_month.day)
-    delta = timedelta(days=7)
+    return start_date, end_date
 
-    print(f"Retrieving data for {len(sensor_ids)} sensors for {year}-{month:02d}...")
+def utc_now():
+    """Current UTC time as a naive datetime, matching decoded MessageDate values."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
-    for idx, sensor_id in enumerate(sensor_ids):
-        print(f"\nProcessing sensor {sensor_id} ({idx + 1}/{len(sensor_ids)})")
-        output_file = os.path.join(output_folder, f"sensor_{sensor_id}_{year}_{month:02d}.csv")
-
-        if os.path.exists(output_file):
-            print(f"Data already exists for {sensor_id}, loading from file.")
-            sensor_df = pd.read_csv(output_file)
-        else:
-            sensor_data_list = []
-            current_start = start_date
-            while current_start <= end_date:
-                current_end = min(current_start + delta, end_date)
-                from_date = current_start.strftime("%m/%d/%Y")
-                to_date = current_end.strftime("%m/%d/%Y")
-                data_chunk = sensor_data(sensor_id, from_date, to_date, api_key, secret_key)
-                sensor_data_list.extend(data_chunk or [])
-                current_start = current_end + timedelta(days=1)
-
-            if sensor_data_list:
-                sensor_df = pd.DataFrame(sensor_data_list)
-                sensor_df.to_csv(output_file, index=False)
-                print(f"Saved sensor data to {output_file}")
+# Adaptive window bounds, in inclusive days; 8 days reproduces the old fixed 7-day delta
+INITIAL_WINDOW_DAYS = 8
+MIN_WINDOW_DAYS = 1
+MAX_WINDOW_DAYS = 31
+# Aim for responses of about this many messages
+TARGET_MESSAGES = 2000
+
+class WindowSizer:
+    """Sizes a sensor's next fetch window from the message density seen so far.
+
+    Sparse sensors grow towards one request per month; dense sensors shrink
+    so each response stays near TARGET_MESSAGES. A window that timed out or
+    was too large is retried at half the size before it counts as a failure;
+    rate limiting and server errors fail the window straight away.
+    """
+
+    def __init__(self, days=INITIAL_WINDOW_DAYS):
+        self.days = days
+
+    def observe(self, messages, window_days):
+        per_day = messages / max(window_days, 1)
+        ideal = TARGET_MESSAGES / per_day if per_day else MAX_WINDOW_DAYS
+        self.days = int(min(MAX_WINDOW_DAYS, max(MIN_WINDOW_DAYS, ideal)))
+
+    def shrink(self):
+        """Halve the window; False if it is already at the minimum."""
+        if self.days <= MIN_WINDOW_DAYS:
+            return False
+        self.days = max(MIN_WINDOW_DAYS, self.days // 2)
+        return True
+
+class FetchMetrics:
+    """Thread-safe per-sensor request counters for one retrieval run."""
+
+    def __init__(self):
+        self.sensors = {}
+        self.incomplete = set()
+        self._lock = threading.Lock()
+
+    def record(self, sensor_id, window_days, messages):
+        with self._lock:
+            stats = self.sensors.setdefault(sensor_id, {'requests': 0, 'failed': 0, 'messages': 0,
+                                                        'max_window_days': 0})
+            stats['requests'] += 1
+            if messages is None:
+                stats['failed'] += 1
             else:
-                print(f"No data retrieved for sensor {sensor_id}")
+                stats['messages'] += messages
+                stats['max_window_days'] = max(stats['max_window_days'], window_days)
+
+    def record_incomplete(self, sensor_id):
+        """Note a sensor whose month still has windows left to fetch."""
+        with self._lock:
+            self.incomplete.add(sensor_id)
+
+    def report(self):
+        """Print a run summary and return the per-sensor counters as a DataFrame."""
+        table = pd.DataFrame.from_dict(self.sensors, orient='index').rename_axis('SensorID')
+        if table.empty:
+            print("No API requests were made.")
+            return table
+        print(f"API requests: {table['requests'].sum()} for {len(table)} sensors "
+              f"({table['requests'].mean():.1f} per sensor, {table['failed'].sum()} failed, "
+              f"{table['messages'].sum()} messages).")
+        if self.incomplete:
+            print(f"Warning: incomplete data for {len(self.incomplete)} sensor(s): "
+                  f"{sorted(self.incomplete)}; rerun to fetch the missing windows.")
+        return table
+
+def fetch_window(sensor_id, window_start, window_end, api_key, secret_key, metrics=None):
+    """Fetch one window as a typed frame; raises SensorDataError if it still failed after retries."""
+    from_date = window_start.strftime("%m/%d/%Y")
+    to_date = window_end.strftime("%m/%d/%Y")
+    window_days = (window_end - window_start).days + 1
+    try:
+        data_chunk = fetch_sensor_frame(sensor_id, from_date, to_date, api_key, secret_key)
+    except SensorDataError as e:
+        print(f"Error fetching sensor {sensor_id}: {e}")
+        if metrics is not None:
+            metrics.record(sensor_id, window_days, None)
+        raise
+    if metrics is not None:
+        metrics.record(sensor_id, window_days, len(data_chunk))
+    return data_chunk
+
+def fetch_windows(sensor_id, start_date, end_date, api_key, secret_key, metrics=None):
+    """Fetch raw readings for a date range in adaptively sized windows.
+
+    Stops at the first window that fails, returning the readings fetched
+    before it (a frame, or None if there are none) and whether the whole
+    range was covered.
+    """
+    sizer = WindowSizer()
+    frames = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=sizer.days - 1), end_date)
+        try:
+            data_chunk = fetch_window(sensor_id, window_start, window_end, api_key, secret_key, metrics)
+        except SensorDataError as e:
+            if e.shrinkable and sizer.shrink():
+                continue
+            print(f"Warning: stopped sensor {sensor_id} at the window starting {window_start:%Y-%m-%d}.")
+            return combine_windows(frames), False
+        sizer.observe(len(data_chunk), (window_end - window_start).days + 1)
+        if not data_chunk.empty:
+            frames.append(data_chunk)
+        window_start = window_end + timedelta(days=1)
+    return combine_windows(frames), True
+
+def combine_windows(frames):
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def fetch_new_readings(sensor_id, since, until, api_key, secret_key, metrics=None):
+    """Fetch readings strictly newer than `since` up to the day of `until`.
+
+    The API works in whole days, so the window starts on the day of `since`
+    and anything at or before the watermark is dropped afterwards. Because
+    windows are fetched in order, a failure leaves a gap-free prefix, so the
+    returned readings are always safe to append and advance the watermark.
+    Returns (new readings or None, whether the whole range was covered).
+    """
+    start_date = datetime.combine(since.date(), datetime.min.time())
+    sensor_df, covered = fetch_windows(sensor_id, start_date, until, api_key, secret_key, metrics)
+    if sensor_df is None:
+        return None, covered
+    sensor_df = normalize_readings(sensor_df, sensor_id)
+    sensor_df = sensor_df[sensor_df['timestamp'] > since]
+    return (sensor_df if not sensor_df.empty else None), covered
+
+def window_key(window_start, window_end):
+    return f"{window_start:%Y%m%d}-{window_end:%Y%m%d}"
+
+def covered_days(completed, end_date):
+    """Days covered by journaled windows ("start-end" keys, inclusive)."""
+    days = set()
+    for key in completed:
+        first, _, last = key.partition("-")
+        day = datetime.strptime(first, "%Y%m%d")
+        # Keys without an end date come from fixed 8-day windows
+        last_day = (datetime.strptime(last, "%Y%m%d") if last
+                    else min(day + timedelta(days=INITIAL_WINDOW_DAYS - 1), end_date))
+        while day <= last_day:
+            days.add(day)
+            day += timedelta(days=1)
+    return days
+
+def fetch_month_windows(sensor_id, year, month, api_key, secret_key, output_folder, metrics=None):
+    """Fetch a sensor-month window by window, journaling each completed window.
+
+    Window sizes adapt to the sensor's message density. Days already covered
+    by the journal are skipped, so rerunning after a failure only requests
+    what is missing. Returns the start of the first window that failed, or
+    None once the whole month is covered.
+    """
+    start_date, end_date = month_bounds(year, month)
+    done = covered_days(load_journal(output_folder, sensor_id, year, month) or set(), end_date)
+    sizer = WindowSizer()
+    failed, first_failed = 0, None
+    window_start = start_date
+    while window_start <= end_date:
+        if window_start in done:
+            window_start += timedelta(days=1)
+            continue
+        window_end = min(window_start + timedelta(days=sizer.days - 1), end_date)
+        # Never refetch a journaled day inside the window
+        for offset in range((window_end - window_start).days + 1):
+            if window_start + timedelta(days=offset) in done:
+                window_end = window_start + timedelta(days=offset - 1)
+                break
+
+        try:
+            data_chunk = fetch_window(sensor_id, window_start, window_end, api_key, secret_key, metrics)
+        except SensorDataError as e:
+            if e.shrinkable and sizer.shrink():
                 continue
+            failed += 1
+            first_failed = first_failed or window_start
+            window_start = window_end + timedelta(days=1)
+            continue
+        sizer.observe(len(data_chunk), (window_end - window_start).days + 1)
+        key = window_key(window_start, window_end)
+        if not data_chunk.empty:
+            write_window(normalize_readings(data_chunk, sensor_id),
+                         output_folder, sensor_id, year, month, key)
+        record_window(output_folder, sensor_id, year, month, key)
+        window_start = window_end + timedelta(days=1)
 
-        if not sensor_df.empty:
-            sensor_df['SensorID'] = sensor_id
-            all_data = pd.concat([all_data, sensor_df], ignore_index=True)
+    if failed:
+        print(f"Warning: {failed} window(s) failed for sensor {sensor_id} in {year}-{month:02d}; "
+              f"rerun to fetch only those windows.")
+    return first_failed
+
+def windows_pending(output_folder, sensor_id, year, month):
+    """True if a journaled fetch of this sensor-month has days left to fetch."""
+    completed = load_journal(output_folder, sensor_id, year, month)
+    if completed is None:
+        return False
+    start_date, end_date = month_bounds(year, month)
+    done = covered_days(completed, end_date)
+    return any(start_date + timedelta(days=offset) not in done
+               for offset in range((end_date - start_date).days + 1))
+
+def fetch_sensor_month(sensor_id, year, month, api_key, secret_key, output_folder, columns=None,
+                       incremental=False, metrics=None):
+    """Return one sensor's monthly data, from the Parquet cache or the API.
+
+    An interrupted or partially failed fetch resumes its missing windows.
+    With `incremental`, a cached month that was written before the month
+    ended is topped up with only the readings newer than its last one.
+
+    A month with windows still missing is returned with
+    `attrs['incomplete']` set, and the sensor's watermark is not advanced
+    past the first missing window.
+    """
+    start_date, end_date = month_bounds(year, month)
+    month_over = utc_now() >= end_date + timedelta(days=1)
+
+    if not windows_pending(output_folder, sensor_id, year, month):
+        sensor_df = read_sensor_month(output_folder, sensor_id, year, month, columns=columns)
+        if sensor_df is not None:
+            if not incremental or is_complete(output_folder, sensor_id, year, month):
+                print(f"Data already exists for {sensor_id}, loading from cache.")
+                return sensor_df
+            cached = read_sensor_month(output_folder, sensor_id, year, month, columns=['timestamp'])
+            since = cached['timestamp'].max() if not cached.empty else start_date - timedelta(microseconds=1)
+            print(f"Topping up sensor {sensor_id} after {since}.")
+            new_df, covered = fetch_new_readings(sensor_id, since, end_date, api_key, secret_key,
+                                                 metrics)
+            if new_df is not None:
+                append_readings(new_df, output_folder, sensor_id)
+                update_watermark(output_folder, sensor_id, new_df['timestamp'].max())
+            if covered and month_over:
+                mark_complete(output_folder, sensor_id, year, month)
+            sensor_df = read_sensor_month(output_folder, sensor_id, year, month, columns=columns)
+            if not covered:
+                mark_incomplete(sensor_df, sensor_id, metrics)
+            return sensor_df
+
+    first_failed = fetch_month_windows(sensor_id, year, month, api_key, secret_key, output_folder,
+                                       metrics)
+    sensor_df = read_sensor_month(output_folder, sensor_id, year, month)
+    if first_failed is None and month_over:
+        mark_complete(output_folder, sensor_id, year, month)
+    if sensor_df is None:
+        print(f"No data retrieved for sensor {sensor_id}")
+        if first_failed is not None and metrics is not None:
+            metrics.record_incomplete(sensor_id)
+        return None
+
+    if first_failed is None:
+        update_watermark(output_folder, sensor_id, sensor_df['timestamp'].max())
+    else:
+        # Readings after the gap must not carry the watermark past it
+        update_watermark(output_folder, sensor_id,
+                         sensor_df.loc[sensor_df['timestamp'] < first_failed, 'timestamp'].max())
+    print(f"Cached sensor data for {sensor_id}")
+    sensor_df = sensor_df[columns] if columns else sensor_df
+    if first_failed is not None:
+        mark_incomplete(sensor_df, sensor_id, metrics)
+    return sensor_df
+
+def mark_incomplete(sensor_df, sensor_id, metrics=None):
+    """Flag a sensor-month that still has windows to fetch."""
+    if sensor_df is not None:
+        sensor_df.attrs['incomplete'] = True
+    if metrics is not None:
+        metrics.record_incomplete(sensor_id)
+
+def sync_sensor(sensor_id, api_key, secret_key, output_folder, until=None, metrics=None):
+    """Append readings newer than the sensor's watermark to the cache.
+
+    Sensors without a watermark start from their latest cached reading, or
+    from the start of the current month if nothing is cached yet.
+    Returns the number of new readings.
+    """
+    until = until or utc_now()
+    since = load_watermarks(output_folder).get(int(sensor_id))
+    if since is None:
+        since = cached_last_message(output_folder, sensor_id)
+    if since is None:
+        since = datetime(until.year, until.month, 1) - timedelta(microseconds=1)
+
+    new_df, covered = fetch_new_readings(sensor_id, since, until, api_key, secret_key, metrics)
+    if not covered:
+        print(f"Warning: sync of sensor {sensor_id} is incomplete; the next run resumes from its watermark.")
+    if new_df is None:
+        print(f"No new readings for sensor {sensor_id} since {since}.")
+        return 0
+
+    appended = append_readings(new_df, output_folder, sensor_id)
+    update_watermark(output_folder, sensor_id, new_df['timestamp'].max())
+    print(f"Appended {appended} new readings for sensor {sensor_id}.")
+    return appended
+
+def sync_sensors(sensor_ids, api_key, secret_key, output_folder, until=None, max_workers=4):
+    """Incrementally sync many sensors; suitable for a daily scheduled run."""
+    metrics = FetchMetrics()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        counts = list(pool.map(
+            lambda sensor_id: sync_sensor(sensor_id, api_key, secret_key, output_folder, until, metrics),
+            sensor_ids))
+    print(f"\nSynced {len(sensor_ids)} sensors, {sum(counts)} new readings.")
+    metrics.report()
+    return dict(zip(sensor_ids, counts))
+
+def get_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder, max_workers=4,
+                     columns=None, incremental=False):
+    """Download and cache monthly data per sensor as Parquet partitions.
+
+    Cached readings come back typed (`timestamp` decoded, `PlotValue` float);
+    pass `columns` to read only what the caller needs. With `incremental`,
+    months cached before they ended are topped up instead of trusted as-is.
+
+    Sensors are fetched on a bounded thread pool (`max_workers=1` runs them
+    serially); requests are rate limited per host by the shared API client.
+    Results are combined in `sensor_ids` order regardless of completion order.
+    """
+    frames = []
+    metrics = FetchMetrics()
+
+    print(f"Retrieving data for {len(sensor_ids)} sensors for {year}-{month:02d}...")
+
+    def fetch(indexed):
+        idx, sensor_id = indexed
+        print(f"\nProcessing sensor {sensor_id} ({idx + 1}/{len(sensor_ids)})")
+        return fetch_sensor_month(sensor_id, year, month, api_key, secret_key, output_folder,
+                                  columns=columns, incremental=incremental, metrics=metrics)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        # map() yields in submission order, keeping the output deterministic
+        results = pool.map(fetch, enumerate(sensor_ids))
+        for sensor_id, sensor_df in zip(sensor_ids, results):
+            if sensor_df is not None and not sensor_df.empty:
+                frames.append(sensor_df)
+
+    # Build the combined dataset once instead of re-copying it per sensor
+    all_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    all_data.attrs['incomplete_sensors'] = sorted(metrics.incomplete)
 
     print(f"\nTotal records retrieved: {len(all_data)}")
+    metrics.report()
     return all_data
+
+def iter_monthly_data(sensor_ids, year, month, api_key, secret_key, output_folder, max_workers=4,
+                      columns=None, incremental=False):
+    """Yield each sensor's monthly data in `sensor_ids` order, one frame at a time.
+
+    At most `max_workers` sensors are fetched ahead of the consumer, so only
+    a handful of sensor-months are held in memory at once.
+    """
+    print(f"Streaming data for {len(sensor_ids)} sensors for {year}-{month:02d}...")
+    metrics = FetchMetrics()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = deque()
+        for sensor_id in sensor_ids:
+            pending.append(pool.submit(fetch_sensor_month, sensor_id, year, month, api_key,
+                                       secret_key, output_folder, columns, incremental, metrics))
+            if len(pending) >= max(1, max_workers):
+                sensor_df = pending.popleft().result()
+                if sensor_df is not None and not sensor_df.empty:
+                    yield sensor_df
+        while pending:
+            sensor_df = pending.popleft().result()
+            if sensor_df is not None and not sensor_df.empty:
+                yield sensor_df
+    metrics.report()
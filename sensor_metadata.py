@@ -0,0 +1,127 @@
+# sensor_metadata.py
+import os
+import sqlite3
+import time
+import pandas as pd
+from sensor_api import sensor_inventory
+from sensor_data_processor import parse_custom_dates
+
+METADATA_DB = "sensor_metadata.sqlite"
+DEFAULT_TTL = 24 * 3600  # seconds before the cached inventory is refreshed
+
+# SensorListFull fields kept in the cache, and the column each one is stored in
+INVENTORY_FIELDS = {'SensorID': 'SensorID', 'SensorName': 'SensorName',
+                    'MonnitApplicationID': 'ApplicationID', 'ReportInterval': 'ReportInterval',
+                    'LastCommunicationDate': 'LastCommunicationDate'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Sensor (
+    SensorID INTEGER PRIMARY KEY,
+    SensorName TEXT,
+    ApplicationID INTEGER,
+    ReportInterval REAL,
+    LastCommunicationDate TEXT,
+    UpdatedAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Refresh (
+    Name TEXT PRIMARY KEY,
+    RefreshedAt REAL NOT NULL
+);
+"""
+
+# Rows are only rewritten when a field actually changed
+UPSERT = """
+INSERT INTO Sensor (SensorID, SensorName, ApplicationID, ReportInterval, LastCommunicationDate, UpdatedAt)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(SensorID) DO UPDATE SET
+    SensorName = excluded.SensorName,
+    ApplicationID = excluded.ApplicationID,
+    ReportInterval = excluded.ReportInterval,
+    LastCommunicationDate = excluded.LastCommunicationDate,
+    UpdatedAt = excluded.UpdatedAt
+WHERE Sensor.SensorName IS NOT excluded.SensorName
+   OR Sensor.ApplicationID IS NOT excluded.ApplicationID
+   OR Sensor.ReportInterval IS NOT excluded.ReportInterval
+   OR Sensor.LastCommunicationDate IS NOT excluded.LastCommunicationDate
+"""
+
+def connect(output_folder):
+    """Open (and create if needed) the metadata database in `output_folder`."""
+    os.makedirs(output_folder, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(output_folder, METADATA_DB))
+    conn.executescript(SCHEMA)
+    return conn
+
+def last_refresh(conn):
+    row = conn.execute("SELECT RefreshedAt FROM Refresh WHERE Name = 'inventory'").fetchone()
+    return row[0] if row else None
+
+def inventory_rows(inventory, now):
+    """Turn a SensorListFull DataFrame into Sensor table rows."""
+    inventory = inventory.reindex(columns=list(INVENTORY_FIELDS)).drop_duplicates(subset='SensorID')
+    last_seen = parse_custom_dates(inventory['LastCommunicationDate'])
+    interval = pd.to_numeric(inventory['ReportInterval'], errors='coerce')
+    application = pd.to_numeric(inventory['MonnitApplicationID'], errors='coerce')
+    return [
+        (int(sensor_id),
+         None if pd.isna(name) else str(name),
+         None if pd.isna(app) else int(app),
+         None if pd.isna(minutes) else float(minutes),
+         None if pd.isna(seen) else seen.isoformat(),
+         now)
+        for sensor_id, name, app, minutes, seen in zip(inventory['SensorID'], inventory['SensorName'],
+                                                       application, interval, last_seen)
+    ]
+
+def refresh_metadata(api_key, secret_key, output_folder, client=None):
+    """Download the inventory and upsert it into the cache.
+
+    Sensors no longer in the inventory are dropped. Returns the number of
+    rows inserted or changed, or None if the inventory call failed.
+    """
+    inventory = sensor_inventory(api_key, secret_key, client=client)
+    if inventory is None:
+        return None
+
+    now = time.time()
+    rows = inventory_rows(inventory, now) if not inventory.empty else []
+    with connect(output_folder) as conn:
+        before = conn.total_changes
+        conn.executemany(UPSERT, rows)
+        changed = conn.total_changes - before
+        conn.execute("CREATE TEMP TABLE Current (SensorID INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO Current VALUES (?)", [(row[0],) for row in rows])
+        conn.execute("DELETE FROM Sensor WHERE SensorID NOT IN (SELECT SensorID FROM Current)")
+        conn.execute("INSERT OR REPLACE INTO Refresh (Name, RefreshedAt) VALUES ('inventory', ?)", (now,))
+    conn.close()
+    print(f"Sensor metadata refreshed: {len(rows)} sensors, {changed} new or changed.")
+    return changed
+
+def load_metadata(output_folder):
+    """Cached sensor metadata indexed by SensorID (empty if never refreshed)."""
+    with connect(output_folder) as conn:
+        metadata = pd.read_sql_query(
+            "SELECT SensorID, SensorName, ApplicationID, ReportInterval, LastCommunicationDate "
+            "FROM Sensor ORDER BY SensorID", conn, index_col='SensorID')
+    conn.close()
+    metadata['LastCommunicationDate'] = pd.to_datetime(metadata['LastCommunicationDate'])
+    return metadata
+
+def cached_sensor_metadata(api_key, secret_key, output_folder, ttl=DEFAULT_TTL, client=None):
+    """Sensor metadata, calling SensorListFull only when the cache is older than `ttl` seconds.
+
+    If a refresh fails, the stale cache is used rather than aborting the run.
+    """
+    with connect(output_folder) as conn:
+        refreshed_at = last_refresh(conn)
+    conn.close()
+    if refreshed_at is None or time.time() - refreshed_at > ttl:
+        if refresh_metadata(api_key, secret_key, output_folder, client=client) is None:
+            print("Using stale sensor metadata." if refreshed_at else "No cached sensor metadata to fall back on.")
+    else:
+        print("Using cached sensor list.")
+    return load_metadata(output_folder)
+
+def cached_sensor_list(api_key, secret_key, output_folder, ttl=DEFAULT_TTL, client=None):
+    """Drop-in for sensor_list backed by the metadata cache."""
+    return cached_sensor_metadata(api_key, secret_key, output_folder, ttl, client).index.to_numpy()
@@ -0,0 +1,182 @@
+# sensor_rollups.py
+import os
+import numpy as np
+import pandas as pd
+from atomic_files import atomic_path
+from sensor_cache import read_sensor_month
+from sensor_data_processor import load_limits
+
+ROLLUP_DIR = "rollups"
+FREQUENCIES = {'hourly': 'h', 'daily': 'D'}
+
+# Activation energy over the gas constant used for MKT (83.144 kJ/mol / 8.3144 J/(mol*K))
+MKT_DH_R = 10000.0
+
+# Bucket aggregates and how two partials of the same bucket combine
+ROLLUP_MERGE = {'count': 'sum', 'total': 'sum', 'min': 'min', 'max': 'max',
+                'mkt_sum': 'sum', 'last': 'max'}
+
+def rollup_dir(output_folder, freq, sensor_id, year, month):
+    """Hive-style partition folder holding one sensor-month of `freq` buckets."""
+    return os.path.join(output_folder, ROLLUP_DIR, freq, f"year={year}", f"month={month:02d}",
+                        f"sensor_id={sensor_id}")
+
+def bucket_aggregates(readings, freq):
+    """Per-(SensorID, bucket) count, sum, extremes, MKT exponent sum and latest reading time.
+
+    The MKT term treats PlotValue as degrees Celsius.
+    """
+    kelvin = readings['PlotValue'] + 273.15
+    frame = readings.assign(bucket=readings['timestamp'].dt.floor(FREQUENCIES[freq]),
+                            mkt=np.exp(-MKT_DH_R / kelvin.where(kelvin > 0)))
+    return frame.groupby(['SensorID', 'bucket']).agg(
+        count=('PlotValue', 'count'),
+        total=('PlotValue', 'sum'),
+        min=('PlotValue', 'min'),
+        max=('PlotValue', 'max'),
+        mkt_sum=('mkt', 'sum'),
+        last=('timestamp', 'max')
+    ).reset_index()
+
+def read_rollup_month(output_folder, freq, sensor_id, year, month):
+    path = os.path.join(rollup_dir(output_folder, freq, sensor_id, year, month), "data.parquet")
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+def write_rollup_month(buckets, output_folder, freq, sensor_id, year, month):
+    folder = rollup_dir(output_folder, freq, sensor_id, year, month)
+    os.makedirs(folder, exist_ok=True)
+    with atomic_path(os.path.join(folder, "data.parquet")) as tmp_path:
+        buckets.to_parquet(tmp_path, index=False)
+
+def clean_readings(readings):
+    readings = readings[['SensorID', 'timestamp', 'PlotValue']].assign(
+        PlotValue=pd.to_numeric(readings['PlotValue'], errors='coerce'))
+    return readings.dropna(subset=['timestamp', 'PlotValue'])
+
+def month_readings(output_folder, sensor_id, year, month, readings):
+    """Every known reading of a sensor-month: the cached ones plus `readings`, without repeats."""
+    cached = read_sensor_month(output_folder, sensor_id, year, month, columns=['timestamp', 'PlotValue'])
+    if cached is None or cached.empty:
+        return readings
+    cached = clean_readings(cached.assign(SensorID=sensor_id))
+    return pd.concat([cached, readings], ignore_index=True).drop_duplicates(subset='timestamp')
+
+def update_rollups(readings, output_folder):
+    """Fold readings into the hourly and daily rollups; returns the number of buckets touched.
+
+    Only the buckets the readings fall in are rewritten. A bucket seen for
+    the first time is built from the readings; a bucket already rolled up
+    is recomputed from the cached sensor-month plus the readings, so late
+    readings (e.g. a refetched gap) are added and passing a whole month
+    again is harmless.
+    """
+    readings = clean_readings(readings)
+    if readings.empty:
+        return 0
+
+    touched = 0
+    months = readings['timestamp'].dt.to_period('M')
+    for (sensor_id, period), sensor_month in readings.groupby(['SensorID', months]):
+        known = None
+        for freq in FREQUENCIES:
+            buckets = bucket_aggregates(sensor_month, freq)
+            existing = read_rollup_month(output_folder, freq, sensor_id, period.year, period.month)
+            if existing is not None:
+                seen = buckets['bucket'].isin(existing['bucket']).to_numpy()
+                if seen.any():
+                    if known is None:
+                        known = month_readings(output_folder, sensor_id, period.year, period.month,
+                                               sensor_month)
+                    in_seen = known['timestamp'].dt.floor(FREQUENCIES[freq]).isin(buckets['bucket'][seen])
+                    buckets = pd.concat([buckets[~seen], bucket_aggregates(known[in_seen], freq)])
+                kept = existing[~existing['bucket'].isin(buckets['bucket'])]
+                buckets = pd.concat([kept, buckets], ignore_index=True)
+            touched += len(buckets) - (len(kept) if existing is not None else 0)
+            buckets = buckets.sort_values('bucket', ignore_index=True)
+            write_rollup_month(buckets, output_folder, freq, sensor_id, period.year, period.month)
+    return touched
+
+def with_rollups(chunks, output_folder):
+    """Pipeline stage: update the rollups from each chunk of readings and pass it on."""
+    for chunk in chunks:
+        if chunk is not None and not chunk.empty:
+            update_rollups(chunk, output_folder)
+        yield chunk
+
+def load_rollups(output_folder, freq, year=None, month=None, sensor_ids=None):
+    """Read rollup buckets, filtered on the partition columns."""
+    root = os.path.join(output_folder, ROLLUP_DIR, freq)
+    if not os.path.isdir(root):
+        return None
+    filters = []
+    if year is not None:
+        filters.append(('year', '=', year))
+    if month is not None:
+        filters.append(('month', '=', month))
+    if sensor_ids is not None:
+        filters.append(('sensor_id', 'in', [int(s) for s in sensor_ids]))
+    data = pd.read_parquet(root, filters=filters or None)
+    return data.drop(columns=['year', 'month', 'sensor_id'], errors='ignore')
+
+def mean_kinetic_temperature(mkt_sum, count):
+    """MKT in degrees Celsius from summed exp(-dH/RT) terms."""
+    return MKT_DH_R / -np.log(mkt_sum / count) - 273.15
+
+def rolling_averages(output_folder, sensor_id, window='24h'):
+    """Hourly series of the trailing `window` mean and MKT for one sensor, from the hourly rollups."""
+    hourly = load_rollups(output_folder, 'hourly', sensor_ids=[sensor_id])
+    if hourly is None or hourly.empty:
+        return None
+    sums = hourly.set_index('bucket').sort_index()[['count', 'total', 'mkt_sum']].rolling(window).sum()
+    return pd.DataFrame({
+        'count': sums['count'].astype('int64'),
+        'mean': sums['total'] / sums['count'],
+        'mkt': mean_kinetic_temperature(sums['mkt_sum'], sums['count']),
+    })
+
+def exceeds(buckets, limits):
+    """Flag buckets whose min or max falls outside the sensor's limits."""
+    bounds = limits.reindex(buckets['SensorID'])
+    return ((buckets['min'].to_numpy() < bounds['lim_min'].to_numpy()) |
+            (buckets['max'].to_numpy() > bounds['lim_max'].to_numpy()))
+
+def rollup_report(output_folder, year, month, limits_filepath=None, limits=None):
+    """Monthly per-sensor summary derived from the rollups instead of the raw readings.
+
+    Gives min/max/mean and MKT per sensor, with the days and hours that
+    hold at least one out-of-spec reading. Those counts are exact, as a
+    bucket is out of spec exactly when its min or max is. Saved as
+    rollup_analysis_<year>_<month>.csv.
+    """
+    daily = load_rollups(output_folder, 'daily', year, month)
+    if daily is None or daily.empty:
+        print("No rollups for this month.")
+        return None
+    hourly = load_rollups(output_folder, 'hourly', year, month)
+    if limits is None:
+        print("Loading limits...")
+        limits = load_limits(limits_filepath)
+
+    monthly = daily.groupby('SensorID').agg(ROLLUP_MERGE)
+    sensor_limits = limits.reindex(monthly.index)
+    agg = pd.DataFrame({
+        'SensorName': sensor_limits['SensorName'],
+        'UOM': sensor_limits['uom'],
+        'readings': monthly['count'],
+        'min': monthly['min'],
+        'max': monthly['max'],
+        'mean': monthly['total'] / monthly['count'],
+        'mkt': mean_kinetic_temperature(monthly['mkt_sum'], monthly['count']),
+        'lim_min': sensor_limits['lim_min'],
+        'lim_max': sensor_limits['lim_max'],
+        'non_compliant_days': daily[exceeds(daily, limits)].groupby('SensorID').size()
+                                  .reindex(monthly.index, fill_value=0),
+        'non_compliant_hour_buckets': hourly[exceeds(hourly, limits)].groupby('SensorID').size()
+                                          .reindex(monthly.index, fill_value=0),
+    }, index=monthly.index).rename_axis('SensorID').reset_index()
+    agg['Compliant Yes/No'] = np.where(agg['non_compliant_days'] > 0, 'No', 'Yes')
+
+    report_file = os.path.join(output_folder, f"rollup_analysis_{year}_{month:02d}.csv")
+    agg.to_csv(report_file, index=False)
+    print(f"Saved rollup analysis to {report_file}")
+    return agg
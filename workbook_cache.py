@@ -0,0 +1,211 @@
+# workbook_cache.py
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from atomic_files import atomic_path, write_json
+
+SNAPSHOT_DIR = "_workbook_cache"
+HASH_INDEX = "_hashes.json"
+VOCABULARY_FILE = "_vocabulary.json"
+# Bumped whenever parse_sheet's output changes, so older snapshots are not reused
+SNAPSHOT_FORMAT = 3
+
+COMPLAINTS_SHEET = "RD_All_Complaints"
+ORDERS_SHEET_PREFIX = "RD_Orders_"
+
+# Columns the analyses use from each kind of sheet; date columns are parsed on load
+COMPLAINTS_COLUMNS = ['Case Created Date', 'Cost Centre', 'Problem Sub-Type', 'Simple Product Code']
+ORDERS_COLUMNS = ['Order Date', 'Order No', 'Item', 'Business Unit']
+DATE_COLUMNS = {'Case Created Date', 'Order Date'}
+
+# Dimension columns stored as categoricals, and the vocabulary each one draws its
+# categories from (Cost Centre and Business Unit name the same units)
+DIMENSIONS = {'Cost Centre': 'unit', 'Business Unit': 'unit', 'Problem Sub-Type': 'problem',
+              'Simple Product Code': 'product_code', 'Item': 'item'}
+# Dimensions compared case-insensitively (lower-cased on load)
+LOWERCASE_DIMENSIONS = {'Item'}
+# Identifier columns stored as text, whether the cells hold numbers or text
+ID_COLUMNS = {'Order No'}
+
+# Sheets already loaded by this process, keyed by (path, sheet, columns, file version)
+_sheets = {}
+# Vocabularies already read by this process, keyed by snapshot folder
+_vocabularies = {}
+
+def sheet_columns(sheet_name):
+    """Columns to load for a sheet, or None (all columns) for unknown sheets."""
+    if sheet_name == COMPLAINTS_SHEET:
+        return COMPLAINTS_COLUMNS
+    if sheet_name.startswith(ORDERS_SHEET_PREFIX):
+        return ORDERS_COLUMNS
+    return None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def workbook_hash(file_path, snapshot_dir):
+    """Content hash of the workbook, only recomputed when its mtime or size changes."""
+    stat = os.stat(file_path)
+    index_path = os.path.join(snapshot_dir, HASH_INDEX)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    entry = index.get(os.path.abspath(file_path))
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['sha256']
+
+    sha256 = file_sha256(file_path)
+    index[os.path.abspath(file_path)] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+    os.makedirs(snapshot_dir, exist_ok=True)
+    write_json(index_path, index, indent=1)
+    return sha256
+
+def sheet_names(file_path, snapshot_dir=None):
+    """Sheet names of the workbook, remembered per workbook version like the snapshots."""
+    snapshot_dir = snapshot_dir or os.path.join(os.path.dirname(os.path.abspath(file_path)), SNAPSHOT_DIR)
+    prefix = f"{os.path.splitext(os.path.basename(file_path))[0]}-sheets-"
+    path = os.path.join(snapshot_dir, prefix + workbook_hash(file_path, snapshot_dir)[:16] + ".json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    names = pd.ExcelFile(file_path).sheet_names
+    for name in os.listdir(snapshot_dir):
+        if name.startswith(prefix):
+            os.remove(os.path.join(snapshot_dir, name))
+    write_json(path, names)
+    return names
+
+def clean_text(series, lower=False):
+    """
+    Stripped (and optionally lower-cased) text as a categorical Series.
+
+    Each distinct value is cleaned once rather than every row, and the input
+    is left untouched. Numbers become their text form; missing values stay missing.
+    """
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return pd.Series(pd.Categorical([None] * len(series)), index=series.index, name=series.name)
+    cleaned = pd.Index(np.asarray(uniques, dtype=object).astype(str)).str.strip()
+    if lower:
+        cleaned = cleaned.str.lower()
+    cleaned_codes, categories = pd.factorize(cleaned)
+    codes = np.where(codes >= 0, cleaned_codes[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index,
+                     name=series.name)
+
+def clean_ids(series):
+    """
+    Identifiers as stripped text, so 1001, 1001.0 and ' 1001' are the same ID.
+
+    Each distinct value is converted once; missing values stay missing.
+    """
+    codes, uniques = pd.factorize(series)
+    cleaned = np.array([str(int(value)) if isinstance(value, (int, float, np.number)) and float(value).is_integer()
+                        else str(value).strip() for value in np.asarray(uniques, dtype=object)] + [None],
+                       dtype=object)
+    return pd.Series(cleaned[codes], index=series.index, name=series.name, dtype=object)
+
+def load_vocabulary(snapshot_dir):
+    if snapshot_dir not in _vocabularies:
+        path = os.path.join(snapshot_dir, VOCABULARY_FILE)
+        vocabulary = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                vocabulary = json.load(f)
+        _vocabularies[snapshot_dir] = vocabulary
+    return _vocabularies[snapshot_dir]
+
+def encode_dimensions(df, snapshot_dir):
+    """
+    Give every dimension column the categories of its shared vocabulary.
+
+    New values are appended to the vocabulary (persisted next to the
+    snapshots), so codes stay stable across sheets and runs and frames from
+    different sheets concatenate without losing their categorical dtype.
+    """
+    vocabulary = load_vocabulary(snapshot_dir)
+    changed = False
+    for col, group in DIMENSIONS.items():
+        if col not in df.columns:
+            continue
+        known = vocabulary.setdefault(group, [])
+        present = df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) \
+            else pd.Index(df[col].dropna().unique())
+        new = present.difference(pd.Index(known, dtype=object))
+        if len(new):
+            known.extend(sorted(str(value) for value in new))
+            changed = True
+    if changed:
+        path = os.path.join(snapshot_dir, VOCABULARY_FILE)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        write_json(path, vocabulary)
+
+    for col, group in DIMENSIONS.items():
+        if col in df.columns:
+            df[col] = pd.Categorical(df[col], categories=vocabulary[group])
+    return df
+
+def parse_sheet(file_path, sheet_name, columns):
+    """
+    Read one sheet from the workbook with only `columns`, dates parsed,
+    dimension columns cleaned into categoricals, IDs as text and other
+    text as strings.
+    """
+    usecols = (lambda col: col in columns) if columns is not None else None
+    df = pd.read_excel(file_path, sheet_name=sheet_name, usecols=usecols)
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif col in DIMENSIONS:
+            df[col] = clean_text(df[col], lower=col in LOWERCASE_DIMENSIONS)
+        elif col in ID_COLUMNS:
+            df[col] = clean_ids(df[col])
+        elif df[col].dtype == object:
+            # Mixed text/number cells become text so the column has one type
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def load_sheet(file_path, sheet_name, columns=None, snapshot_dir=None):
+    """
+    Load a workbook sheet, parsing the XLSX at most once per workbook version.
+
+    Only `columns` are read (by default the ones the analyses use, see
+    sheet_columns), with dimension columns cleaned once and stored as
+    categoricals over a shared vocabulary (see encode_dimensions). Parsed
+    sheets are kept in memory for the rest of the run and saved as Parquet
+    snapshots keyed by the workbook's content hash, so later runs skip the
+    Excel parser until the workbook changes. Returns a fresh copy callers
+    may modify.
+    """
+    columns = columns if columns is not None else sheet_columns(sheet_name)
+    snapshot_dir = snapshot_dir or os.path.join(os.path.dirname(os.path.abspath(file_path)), SNAPSHOT_DIR)
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), sheet_name, tuple(columns or ()), stat.st_mtime_ns, stat.st_size)
+    if key in _sheets:
+        return _sheets[key].copy()
+
+    columns_key = hashlib.sha256(json.dumps([SNAPSHOT_FORMAT, columns]).encode()).hexdigest()[:8]
+    prefix = f"{os.path.splitext(os.path.basename(file_path))[0]}-{sheet_name}-{columns_key}-"
+    snapshot = os.path.join(snapshot_dir, prefix + workbook_hash(file_path, snapshot_dir)[:16] + ".parquet")
+    if os.path.exists(snapshot):
+        df = encode_dimensions(pd.read_parquet(snapshot), snapshot_dir)
+    else:
+        print(f"Parsing sheet '{sheet_name}' from {file_path}...")
+        df = encode_dimensions(parse_sheet(file_path, sheet_name, columns), snapshot_dir)
+        # Replace snapshots of earlier workbook versions
+        for name in os.listdir(snapshot_dir):
+            if name.startswith(prefix):
+                os.remove(os.path.join(snapshot_dir, name))
+        with atomic_path(snapshot) as tmp_path:
+            df.to_parquet(tmp_path, index=False)
+
+    _sheets[key] = df
+    return df.copy()